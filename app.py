@@ -1,15 +1,77 @@
+from os import environ
+
 from flask import Flask
 
 from routes import register_blueprints
+from services.database import db_cli, db_provider
+from utils.book_changes import start_following_book_changes
+from utils.books_cli import books_cli
+from utils.compression import init_compression
+from utils.json_provider import init_json_provider
+from utils.pools_cli import pools_cli
+from utils.pw_cli import pw_cli
+
+
+def warm_up():
+    """Prepare the current process to serve requests without cold-start latency
+
+    Connects to the database, which also starts filling the connection pool up to
+    ``MONGO_MIN_POOL_SIZE``, and builds the in-memory search indexes and recommendation pools in use.
+    Pre-forking servers that load the application before forking should call this
+    from their post-fork hook, since connections are not inherited by the workers.
+    """
+
+    from routes.book_data_related.book_data_fetching import SEARCH_BACKEND
+    from services.recommendation import eligible_book_pools
+    from services.search import book_search_engine, book_suggester
+
+    db_provider.ping()
+    eligible_book_pools.start()
+    start_following_book_changes()
+
+    if SEARCH_BACKEND == "local":
+        book_search_engine.start(wait=True)
+
+    book_suggester.start()
+
+
+def create_app() -> Flask:
+    """Create and configure the application
+
+    Pending migrations and missing indexes are applied unless ``DB_MIGRATE_ON_STARTUP=0``.
+    The process is warmed up with ``warm_up`` before returning if ``WARM_UP=1``.
+
+    Returns
+    -------
+    Flask
+        The configured application
+    """
+
+    app = Flask(__name__)
+    init_json_provider(app)
+    init_compression(app)
+    register_blueprints(app)
+
+    # Started by the first request of every worker process, if not warmed up already
+    app.before_request(start_following_book_changes)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(pw_cli)
+    app.cli.add_command(books_cli)
+    app.cli.add_command(pools_cli)
+
+    @app.route("/")
+    def hello_world():
+        return "Hello, World!"
 
-app = Flask(__name__)
-register_blueprints(app)
+    if environ.get("DB_MIGRATE_ON_STARTUP", "1") == "1":
+        db_provider.run_migrations()
+        db_provider.ensure_indexes()
 
+    if environ.get("WARM_UP") == "1":
+        warm_up()
 
-@app.route("/")
-def hello_world():
-    return "Hello, World!"
+    return app
 
 
 if __name__ == "__main__":
-    app.run()
+    create_app().run()
@@ -0,0 +1,114 @@
+"""Measures the serialization throughput of large feed and library responses with every JSON provider.
+
+Run from the repository root with ``python -m benchmarks.json_benchmark``.
+"converted" is the former approach: converting the ObjectIds and dates of every document
+to strings first, then serializing with Flask's default provider.
+"""
+
+import timeit
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from utils.json_provider import BsonJSONProvider, OrjsonJSONProvider
+
+ITERATIONS = 200
+FEED_ENTRIES = 100
+LIBRARY_BOOKS = 200
+
+
+def _feed_page() -> dict:
+    issued_at = datetime(2024, 1, 1)
+
+    return {
+        "feed": [
+            {
+                "_id": ObjectId(),
+                "issuerUserId": ObjectId(),
+                "issuerNameSurname": "Jane Doe",
+                "issuedAt": issued_at + timedelta(minutes=i),
+                "type": "bookListPublish",
+                "details": {"bookListId": ObjectId(), "bookListName": f"Library {i}"}
+            }
+            for i in range(FEED_ENTRIES)
+        ],
+        "nextCursor": None
+    }
+
+
+def _library_page() -> dict:
+    return {
+        "library": {
+            "bookListId": ObjectId(),
+            "authorId": ObjectId(),
+            "title": "Favourites",
+            "bookCount": LIBRARY_BOOKS,
+            "isPrivate": False,
+            "books": [
+                {
+                    "bookId": ObjectId(),
+                    "title": f"Book {i}",
+                    "authors": ["First Author", "Second Author"],
+                    "thumbnailUrl": f"http://books.google.com/books/content?id={i}&printsec=frontcover&img=1&zoom=1"
+                }
+                for i in range(LIBRARY_BOOKS)
+            ],
+            "nextOffset": None
+        }
+    }
+
+
+def _convert_feed(page: dict) -> dict:
+    for doc in page["feed"]:
+        doc["_id"] = str(doc["_id"])
+        doc["issuerUserId"] = str(doc["issuerUserId"])
+        doc["issuedAt"] = doc["issuedAt"].isoformat()
+        doc["details"]["bookListId"] = str(doc["details"]["bookListId"])
+
+    return page
+
+
+def _convert_library(page: dict) -> dict:
+    library = page["library"]
+    library["bookListId"] = str(library["bookListId"])
+    library["authorId"] = str(library["authorId"])
+
+    for book in library["books"]:
+        book["bookId"] = str(book["bookId"])
+
+    return page
+
+
+def main():
+    app = Flask(__name__)
+    providers = {
+        "converted": DefaultJSONProvider(app),
+        "stdlib": BsonJSONProvider(app),
+        "orjson": OrjsonJSONProvider(app)
+    }
+
+    for name, build_page, convert in [
+        ("feed", _feed_page, _convert_feed),
+        ("library", _library_page, _convert_library)
+    ]:
+        size = len(providers["orjson"].dumps(build_page()))
+        print(f"{name} payload ({size / 1024:.0f} KiB):")
+
+        for provider_name, provider in providers.items():
+            # Building the page is timed separately, since the conversion works in place
+            pages = [build_page() for _ in range(ITERATIONS)]
+
+            if provider_name == "converted":
+                serialize = lambda: provider.dumps(convert(pages.pop())).encode()  # noqa: E731
+            else:
+                serialize = lambda: provider.dumps(pages.pop()).encode()  # noqa: E731
+
+            elapsed = timeit.timeit(serialize, number=ITERATIONS)
+
+            print(f"  {provider_name:10} {ITERATIONS / elapsed:8.0f} responses/s {size * ITERATIONS / elapsed / 1e6:8.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Measures the throughput of the pool decay job in users per second, without the database round trips.
+
+Run from the repository root with ``python -m benchmarks.pool_decay_benchmark``.
+The database is not contacted, so the numbers are an upper bound of what a run can reach.
+"""
+
+import random
+import time
+
+from bson import ObjectId
+
+from utils.pool_decay import build_decay_operations
+from utils.pool_ops import WEIGHT_LIMIT
+
+USERS = 100_000
+CHUNK_SIZES = [100, 1000, 10000]
+CATEGORIES = [f"Category {i}" for i in range(40)]
+CATEGORIES_PER_USER = 8
+
+
+def main():
+    pools = [
+        {
+            "_id": ObjectId(),
+            "categories": {
+                category: random.randint(0, WEIGHT_LIMIT)
+                for category in random.sample(CATEGORIES, CATEGORIES_PER_USER)
+            }
+        }
+        for _ in range(USERS)
+    ]
+
+    for chunk_size in CHUNK_SIZES:
+        run_id = ObjectId()
+        start = time.perf_counter()
+
+        for chunk_start in range(0, len(pools), chunk_size):
+            build_decay_operations(pools[chunk_start:chunk_start + chunk_size], run_id)
+
+        elapsed = time.perf_counter() - start
+
+        print(f"chunk size {chunk_size:>6}   {len(pools) / elapsed:12,.0f} users/s")
+
+
+if __name__ == "__main__":
+    main()
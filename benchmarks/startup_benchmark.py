@@ -0,0 +1,49 @@
+"""Measures the import and boot latency of the application in fresh interpreters.
+
+Run from the repository root with ``python -m benchmarks.startup_benchmark``.
+The database is not contacted, since migrations are disabled and connections are lazy.
+"""
+
+import json
+import statistics
+import subprocess
+import sys
+from os import environ
+
+RUNS = 10
+
+_MEASURE_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+booted = time.perf_counter()
+print(json.dumps({"import": imported - start, "boot": booted - imported}))
+"""
+
+
+def main():
+    env = {
+        **environ,
+        "MONGO_URL": environ.get("MONGO_URL", "mongodb://localhost:27017"),
+        "TOKEN_KEY": environ.get("TOKEN_KEY", "benchmark-key"),
+        "DB_MIGRATE_ON_STARTUP": "0",
+    }
+
+    timings = []
+
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", _MEASURE_SCRIPT],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(json.loads(output))
+
+    for phase in ("import", "boot"):
+        values = [timing[phase] * 1000 for timing in timings]
+        print(f"{phase:<8} median {statistics.median(values):8.2f} ms   max {max(values):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Measures the per-request cost of access token validation, with and without the verified token cache.
+
+Run from the repository root with ``python -m benchmarks.token_validation_benchmark``.
+"""
+
+import timeit
+from os import environ
+
+environ.setdefault("TOKEN_KEY", "benchmark-key")
+
+from models.tokens import TokenType  # noqa: E402
+from utils import token_management  # noqa: E402
+
+ITERATIONS = 100_000
+
+
+def main():
+    token = token_management.generate_access_token("0123456789abcdef01234567")
+
+    uncached = timeit.timeit(lambda: token_management._decode_token(token), number=ITERATIONS)
+
+    token_management.validate_token(token, TokenType.ACCESS)
+    cached = timeit.timeit(lambda: token_management.validate_token(token, TokenType.ACCESS), number=ITERATIONS)
+
+    print(f"jwt.decode per call:   {uncached / ITERATIONS * 1e6:8.2f} µs")
+    print(f"cache hit per call:    {cached / ITERATIONS * 1e6:8.2f} µs")
+    print(f"saved per request:     {(uncached - cached) / ITERATIONS * 1e6:8.2f} µs ({uncached / cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
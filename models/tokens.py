@@ -13,11 +13,12 @@ class TokenType(StrEnum):
     REFRESH = auto()
 
 
-@dataclass
+@dataclass(frozen=True)
 class UserToken:
     """Represents a user token.
 
     This model is used to store the user token information.
+    It is immutable, since verified tokens are shared through a cache.
     """
 
     user_id: str
@@ -1,32 +1,28 @@
-from flask import Flask, Blueprint
+from importlib import import_module
 
-from routes.auth_management import logon_routes
-from routes.auth_management import token_routes
-from routes.book_data_related import book_data_fetching
-from routes.feed_related import feed_entries_management
-from routes.library_related import book_library_routes
-from routes.library_related import book_tracking_routes
-from routes.recommendation_algorithm import book_recommendations
-from routes.user_management import user_data_fetching
+from flask import Flask
 
-blueprints: list[Blueprint] = [
-    logon_routes.bp,
-    token_routes.bp,
-    book_recommendations.bp,
-    book_data_fetching.bp,
-    user_data_fetching.bp,
-    feed_entries_management.bp,
-    book_tracking_routes.bp,
-    book_library_routes.bp,
+# Route modules are only imported when their blueprints are registered,
+# so importing this package stays cheap
+blueprint_modules: list[str] = [
+    "routes.auth_management.logon_routes",
+    "routes.auth_management.token_routes",
+    "routes.recommendation_algorithm.book_recommendations",
+    "routes.book_data_related.book_data_fetching",
+    "routes.user_management.user_data_fetching",
+    "routes.feed_related.feed_entries_management",
+    "routes.library_related.book_tracking_routes",
+    "routes.library_related.book_library_routes",
+    "routes.metrics.metrics_routes",
 ]
 
 
 def register_blueprints(app: Flask):
-    for bp in blueprints:
-        app.register_blueprint(bp)
+    for module_name in blueprint_modules:
+        app.register_blueprint(import_module(module_name).bp)
 
 
 __all__ = [
-    "blueprints",
+    "blueprint_modules",
     "register_blueprints",
 ]
@@ -2,12 +2,25 @@ from flask import Blueprint, request, jsonify
 from pymongo.errors import DuplicateKeyError
 
 from services.database import db_provider
-from utils.pw_ops import verify_password, hash_password
+from utils.pw_ops import (
+    HashingPoolUnavailableError,
+    PW_HASH_RETRY_AFTER,
+    hash_password,
+    password_needs_rehash,
+    verify_password,
+)
 from utils.token_management import generate_refresh_token, generate_access_token
 
 bp = Blueprint("logon_routes", __name__)
 
 
+@bp.errorhandler(HashingPoolUnavailableError)
+def handle_hashing_pool_unavailable(_):
+    return jsonify({"error": "Server is busy, try again later"}), 503, {
+        "Retry-After": str(PW_HASH_RETRY_AFTER)
+    }
+
+
 @bp.route("/login", methods=["POST"])
 def post_login_route():
     data = request.get_json()
@@ -19,7 +32,7 @@ def post_login_route():
     if not email or not password:
         return jsonify({"error": "Missing email or password"}), 400
 
-    db_user = db_provider.col_users.find_one({"email": email})
+    db_user = db_provider.col_users.find_one({"email": email}, projection={"password": 1})
 
     # If user does not exist, return an unauthorized error
     if not db_user:
@@ -32,6 +45,17 @@ def post_login_route():
     if not is_pw_correct:
         return jsonify({"error": "Wrong email or password"}), 401
 
+    # Upgrade the stored hash if the argon2 parameters have changed since it was created
+    if password_needs_rehash(db_user["password"]):
+        try:
+            db_provider.col_users.update_one(
+                {"_id": db_user["_id"]},
+                {"$set": {"password": hash_password(password)}}
+            )
+        except HashingPoolUnavailableError:
+            # Not worth failing the login for, it will be retried on the next one
+            pass
+
     # Create a token for the user
     refresh_token = generate_refresh_token(str(db_user["_id"]))
     access_token = generate_access_token(str(db_user["_id"]))
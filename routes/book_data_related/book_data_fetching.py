@@ -1,22 +1,26 @@
+from os import environ
+
 from bson import ObjectId
 from bson.errors import InvalidId
 from flask import Blueprint, jsonify, request
 
 from services.database import db_provider
+from services.search import book_search_engine, book_suggester
+from utils import book_cache, similar_books
+from utils.compression import precompressed
 from utils.flask_auth import login_required
 
 bp = Blueprint("book_data_related", __name__)
 
+# "atlas" uses the Atlas Search "default" index, "local" uses the in-process search engine
+SEARCH_BACKEND = environ.get("SEARCH_BACKEND", "atlas")
 
-@bp.route("/bookSearch", methods=["GET"])
-@login_required
-def search_books_route(user_id: str):
-    search_query = request.args.get("q")
+MAX_BATCH_BOOK_IDS = 100
+MAX_SIMILAR_BOOKS = similar_books.SIMILAR_BOOKS_COUNT
 
-    if not search_query:
-        return jsonify({"error": "Query parameter \"q\" is missing"}), 400
 
-    results = db_provider.col_raw_book_datas.aggregate([
+def _search_books_with_atlas(search_query: str) -> list[dict]:
+    return list(db_provider.col_raw_book_datas.aggregate([
         {
             "$search": {
                 "index": "default",
@@ -37,13 +41,21 @@ def search_books_route(user_id: str):
                 "thumbnail": "$volumeInfo.imageLinks.thumbnail"
             }
         }
-    ])
+    ]))
+
+
+@bp.route("/bookSearch", methods=["GET"])
+@login_required
+def search_books_route(user_id: str):
+    search_query = request.args.get("q")
 
-    def _convert_results_to_api_output(doc):
-        doc["bookId"] = str(doc["bookId"])
-        return doc
+    if not search_query:
+        return jsonify({"error": "Query parameter \"q\" is missing"}), 400
 
-    results = list(map(_convert_results_to_api_output, results))
+    if SEARCH_BACKEND == "local":
+        results = book_search_engine.search(search_query, 5)
+    else:
+        results = _search_books_with_atlas(search_query)
 
     if len(results) == 0:
         return jsonify({"error": "No books found"}), 404
@@ -53,22 +65,81 @@ def search_books_route(user_id: str):
     }), 200
 
 
+@bp.route("/bookSearch/suggest", methods=["GET"])
+@login_required
+def suggest_books_route(user_id: str):
+    search_query = request.args.get("q")
+
+    if not search_query:
+        return jsonify({"error": "Query parameter \"q\" is missing"}), 400
+
+    limit = request.args.get("limit", 5, type=int)
+
+    if limit < 1:
+        return jsonify({"error": "Query parameter \"limit\" must be positive"}), 400
+
+    return jsonify({
+        "suggestions": book_suggester.suggest(search_query, limit)
+    }), 200
+
+
+@bp.route("/books", methods=["GET"])
+@login_required
+def get_books_details_route(user_id: str):
+    param_ids = request.args.get("ids")
+
+    if not param_ids:
+        return jsonify({"error": "Query parameter \"ids\" is missing"}), 400
+
+    book_ids = param_ids.split(",")
+
+    if len(book_ids) > MAX_BATCH_BOOK_IDS:
+        return jsonify({"error": f"At most {MAX_BATCH_BOOK_IDS} book IDs can be requested"}), 400
+
+    if not all(ObjectId.is_valid(book_id) for book_id in book_ids):
+        return jsonify({"error": "Invalid book ID"}), 400
+
+    book_ids = list(dict.fromkeys(map(ObjectId, book_ids)))
+    books = book_cache.get_books_details(book_ids)
+
+    # Keep the requested order, books that are not found are left out
+    return jsonify({
+        "books": [books[book_id] for book_id in book_ids if book_id in books]
+    }), 200
+
+
 @bp.route("/books/<string:book_id>", methods=["GET"])
 @login_required
+@precompressed
 def get_book_details_route(book_id: str, user_id: str):
     try:
-        result = db_provider.col_raw_book_datas.find_one({"_id": ObjectId(book_id)})
+        result = book_cache.get_book_details(ObjectId(book_id))
     except InvalidId:
         return jsonify({"error": "Invalid book ID"}), 400
 
     if result is None:
         return jsonify({"error": "Book not found"}), 404
 
+    return jsonify(result), 200
+
+
+@bp.route("/books/<string:book_id>/similar", methods=["GET"])
+@login_required
+@precompressed
+def get_similar_books_route(book_id: str, user_id: str):
+    if not ObjectId.is_valid(book_id):
+        return jsonify({"error": "Invalid book ID"}), 400
+
+    limit = request.args.get("limit", 10, type=int)
+
+    if not 1 <= limit <= MAX_SIMILAR_BOOKS:
+        return jsonify({"error": f"Query parameter \"limit\" must be between 1 and {MAX_SIMILAR_BOOKS}"}), 400
+
+    results = similar_books.get_similar_books(ObjectId(book_id), limit)
+
+    if results is None:
+        return jsonify({"error": "No similar books found"}), 404
+
     return jsonify({
-        "bookId": str(result["_id"]),
-        "title": result["volumeInfo"]["title"],
-        "authors": result["volumeInfo"]["authors"],
-        "description": result["volumeInfo"].get("description"),
-        "thumbnail": result["volumeInfo"]["imageLinks"]["thumbnail"],
-        "identifiers": result["volumeInfo"].get("industryIdentifiers", []),
+        "similarBooks": results
     }), 200
@@ -1,35 +1,91 @@
+from os import environ
+
 from bson import ObjectId
 from flask import Blueprint, request, jsonify
+from pymongo import DESCENDING
 
 from services.database import db_provider
+from utils import streaming, timeline_ops
 from utils.flask_auth import login_required
+from utils.pagination import InvalidCursorError, encode_cursor, keyset_filter, parse_page_size
 
 bp = Blueprint('feed_entries_management', __name__)
 
+FEED_PAGE_SIZE = int(environ.get('FEED_PAGE_SIZE', 20))
+FEED_MAX_PAGE_SIZE = int(environ.get('FEED_MAX_PAGE_SIZE', 100))
+
+FEED_SORT = [('issuedAt', DESCENDING), ('_id', DESCENDING)]
+
 
 @bp.route('/feed', methods=['GET'])
 @login_required
 def get_feed_entries(user_id: str):
     param_get_updates_from_others = request.args.get('getUpdatesFromOthers')
+    param_cursor = request.args.get('cursor')
 
-    def _convert_object_id_to_string(doc):
-        doc['_id'] = str(doc['_id'])
-        doc['issuerUserId'] = str(doc['issuerUserId'])
-        doc['issuedAt'] = doc['issuedAt'].isoformat()
+    page_size = parse_page_size(request.args.get('pageSize'), FEED_PAGE_SIZE, FEED_MAX_PAGE_SIZE)
 
-        if doc['type'] == 'bookListPublish':
-            doc['details']['bookListId'] = str(doc['details']['bookListId'])
+    if page_size is None:
+        return jsonify({
+            "error": f"pageSize must be between 1 and {FEED_MAX_PAGE_SIZE}"
+        }), 400
 
-        return doc
+    try:
+        query = keyset_filter(param_cursor)
+    except InvalidCursorError:
+        return jsonify({"error": "Invalid cursor"}), 400
 
-    if param_get_updates_from_others == '1':
-        feed_entries = db_provider.col_feed.find()
+    stream_format = streaming.get_stream_format()
+
+    def _stream_page_response(feed_entries):
+        page = {'nextCursor': None}
+
+        def _page_entries():
+            last_entry = None
+
+            for count, entry in enumerate(feed_entries):
+                if count == page_size:
+                    page['nextCursor'] = encode_cursor(last_entry['issuedAt'], last_entry['_id'])
+                    break
+
+                last_entry = entry
+                yield entry
+
+        return streaming.stream_response(stream_format, 'feed', _page_entries(), tail=lambda: page)
+
+    def _build_page_response(feed_entries):
+        if stream_format is not None:
+            return _stream_page_response(feed_entries)
+
+        # One extra entry is fetched to know whether there is a next page
+        feed_entries = list(feed_entries)
+        next_cursor = None
+
+        if len(feed_entries) > page_size:
+            feed_entries = feed_entries[:page_size]
+            last_entry = feed_entries[-1]
+            next_cursor = encode_cursor(last_entry['issuedAt'], last_entry['_id'])
 
         return jsonify({
-            "feed": list(map(_convert_object_id_to_string, feed_entries))
+            "feed": feed_entries,
+            "nextCursor": next_cursor
         }), 200
 
-    user = db_provider.col_users.find_one({"_id": ObjectId(user_id)})
+    if param_get_updates_from_others == '1':
+        feed_entries = db_provider.col_feed.find(query).sort(FEED_SORT).limit(page_size + 1)
+
+        return _build_page_response(feed_entries)
+
+    # Served from the materialized timeline unless the page is older than the timeline holds
+    feed_entries = timeline_ops.get_timeline_entries(user_id, param_cursor, page_size + 1)
+
+    if feed_entries is not None:
+        return _build_page_response(feed_entries)
+
+    user = db_provider.col_users.find_one(
+        {"_id": ObjectId(user_id)},
+        projection={"followedUsers": 1}
+    )
 
     if user is None:
         return jsonify({
@@ -39,12 +95,10 @@ def get_feed_entries(user_id: str):
     follow_list = user.get('followedUsers', [])
     follow_list = [ObjectId(user_id) for user_id in follow_list]
 
-    feed_entries = db_provider.col_feed.find({
-        "issuerUserId": {
-            "$in": follow_list
-        }
-    })
+    query['issuerUserId'] = {
+        "$in": follow_list
+    }
+
+    feed_entries = db_provider.col_feed.find(query).sort(FEED_SORT).limit(page_size + 1)
 
-    return jsonify({
-        "feed": list(map(_convert_object_id_to_string, feed_entries))
-    }), 200
+    return _build_page_response(feed_entries)
@@ -1,14 +1,35 @@
 from datetime import datetime
+from os import environ
 
 from bson import ObjectId
 from flask import Blueprint, request, jsonify
+from pymongo import ReturnDocument
 
 from services.database import db_provider
 from utils.flask_auth import login_required
-from utils import pool_ops
+from utils.pagination import parse_page_size
+from utils import book_summaries, owned_books, pool_ops, streaming, timeline_ops
 
 bp = Blueprint('book_library', __name__)
 
+LIBRARY_PAGE_SIZE = int(environ.get('LIBRARY_PAGE_SIZE', 50))
+LIBRARY_MAX_PAGE_SIZE = int(environ.get('LIBRARY_MAX_PAGE_SIZE', 200))
+
+
+def _publish_library(user_id: str, library_id: ObjectId, title: str):
+    user = db_provider.col_users.find_one({'_id': ObjectId(user_id)}, projection={'nameSurname': 1})
+
+    timeline_ops.publish_feed_entry({
+        'issuerUserId': ObjectId(user_id),
+        'issuerNameSurname': user['nameSurname'],
+        'issuedAt': datetime.now(),
+        'type': 'bookListPublish',
+        'details': {
+            'bookListId': library_id,
+            'bookListName': title
+        }
+    })
+
 
 @bp.route('/libraries', methods=['GET'])
 @login_required
@@ -18,11 +39,6 @@ def get_libraries(user_id: str):
     if param_target_user_id is not None and not ObjectId.is_valid(param_target_user_id):
         return jsonify({'error': 'Invalid userId'}), 400
 
-    def _convert_object_id_to_string(doc):
-        doc['bookListId'] = str(doc['bookListId'])
-        doc['authorId'] = str(doc['authorId'])
-        return doc
-
     aggregation_pipeline = [{
         '$project': {
             '_id': 0,
@@ -46,7 +62,7 @@ def get_libraries(user_id: str):
         libraries = db_provider.col_book_libraries.aggregate(aggregation_pipeline)
 
         return jsonify({
-            'libraries': list(map(_convert_object_id_to_string, libraries))
+            'libraries': list(libraries)
         }), 200
 
     aggregation_pipeline.insert(0, {
@@ -59,7 +75,7 @@ def get_libraries(user_id: str):
     libraries = db_provider.col_book_libraries.aggregate(aggregation_pipeline)
 
     return jsonify({
-        'libraries': list(map(_convert_object_id_to_string, libraries))
+        'libraries': list(libraries)
     }), 200
 
 
@@ -69,6 +85,7 @@ def get_libraries_contain_data(user_id: str, book_id: str):
     if not ObjectId.is_valid(book_id):
         return jsonify({'error': 'Invalid bookId'}), 400
 
+    # Membership and counts are computed by the server, so the book lists are never sent
     aggregation_pipeline = [
         {
             '$match': {
@@ -80,25 +97,18 @@ def get_libraries_contain_data(user_id: str, book_id: str):
                 'bookListId': '$_id',
                 'authorId': 1,
                 'title': 1,
-                'books': 1,
+                'bookCount': {
+                    '$size': '$books'
+                },
+                'containsBook': {
+                    '$in': [ObjectId(book_id), '$books']
+                },
                 'isPrivate': 1
             }
         }
     ]
 
-    libraries = db_provider.col_book_libraries.aggregate(aggregation_pipeline)
-
-    def _convert_to_api_output(doc: dict):
-        doc['bookListId'] = str(doc['bookListId'])
-        doc['authorId'] = str(doc['authorId'])
-        doc['bookCount'] = len(doc['books'])
-        doc['containsBook'] = ObjectId(book_id) in doc['books']
-
-        doc.pop('books')
-
-        return doc
-
-    libraries = list(map(_convert_to_api_output, libraries))
+    libraries = list(db_provider.col_book_libraries.aggregate(aggregation_pipeline))
 
     return jsonify({
         'datas': libraries
@@ -108,15 +118,39 @@ def get_libraries_contain_data(user_id: str, book_id: str):
 @bp.route('/libraries/<string:library_id>', methods=['GET'])
 @login_required
 def get_library(user_id: str, library_id: str):
-    if not ObjectId.is_valid(library_id):
+    if library_id != '_likedBooks' and not ObjectId.is_valid(library_id):
         return jsonify({'error': 'Invalid libraryId'}), 400
 
-    aggregation_pipeline = [
-        {
+    limit = parse_page_size(request.args.get('limit'), LIBRARY_PAGE_SIZE, LIBRARY_MAX_PAGE_SIZE)
+
+    if limit is None:
+        return jsonify({
+            'error': f'limit must be between 1 and {LIBRARY_MAX_PAGE_SIZE}'
+        }), 400
+
+    offset = request.args.get('offset', 0, type=int)
+
+    if offset < 0:
+        return jsonify({'error': 'offset must not be negative'}), 400
+
+    if library_id == '_likedBooks':
+        match_stage = {
+            '$match': {
+                'authorId': ObjectId(user_id),
+                'title': '_likedBooks'
+            }
+        }
+    else:
+        match_stage = {
             '$match': {
                 '_id': ObjectId(library_id)
             }
-        }, {
+        }
+
+    # The header and a page of the books are read from the library document alone
+    aggregation_pipeline = [
+        match_stage,
+        {
             '$project': {
                 '_id': 0,
                 'bookListId': '$_id',
@@ -125,18 +159,29 @@ def get_library(user_id: str, library_id: str):
                 'bookCount': {
                     '$size': '$books'
                 },
-                'isPrivate': 1
+                'isPrivate': 1,
+                'books': {
+                    '$slice': ['$books', offset, limit]
+                },
+                'bookSummaries': 1
             }
-        }
-    ]
-
-    if library_id == "_likedBooks":
-        aggregation_pipeline[0] = {
-            '$match': {
-                'authorId': ObjectId(user_id),
-                'title': '_likedBooks'
+        }, {
+            # Only the summaries of the page's books are looked up, in the same order as the books
+            '$set': {
+                'bookSummaries': {
+                    '$map': {
+                        'input': '$books',
+                        'in': {
+                            '$getField': {
+                                'field': {'$toString': '$$this'},
+                                'input': {'$ifNull': ['$bookSummaries', {}]}
+                            }
+                        }
+                    }
+                }
             }
         }
+    ]
 
     library_results = list(db_provider.col_book_libraries.aggregate(aggregation_pipeline))
 
@@ -145,44 +190,32 @@ def get_library(user_id: str, library_id: str):
 
     library = library_results[0]
 
-    if str(library["authorId"]) != user_id and library["isPrivate"]:
+    if str(library['authorId']) != user_id and library['isPrivate']:
         return jsonify({'error': 'No library found'}), 404
 
-    book_data_results = list(db_provider.col_book_libraries.aggregate([
+    summaries = library.pop('bookSummaries')
+
+    books = (
         {
-            '$match': {
-                '_id': ObjectId(library_id)
-            }
-        }, {
-            '$unwind': '$books'
-        }, {
-            '$lookup': {
-                'from': 'rawBookDatas',
-                'localField': 'books',
-                'foreignField': '_id',
-                'as': 'bookDetails'
-            }
-        }, {
-            '$unwind': '$bookDetails'
-        }, {
-            '$project': {
-                '_id': 0,
-                'bookId': '$bookDetails._id',
-                'title': '$bookDetails.volumeInfo.title',
-                'authors': '$bookDetails.volumeInfo.authors',
-                'thumbnailUrl': '$bookDetails.volumeInfo.imageLinks.thumbnail'
-            }
+            'bookId': book_id,
+            'title': summary.get('title'),
+            'authors': summary.get('authors'),
+            'thumbnailUrl': summary.get('thumbnail')
         }
-    ]))
+        for book_id, summary in zip(library.pop('books'), summaries)
+        if summary is not None
+    )
+
+    next_offset = offset + limit
 
-    library['books'] = book_data_results
+    library['nextOffset'] = next_offset if next_offset < library['bookCount'] else None
 
-    # Convert ObjectIds to strings
-    library['bookListId'] = str(library['bookListId'])
-    library['authorId'] = str(library['authorId'])
+    stream_format = streaming.get_stream_format()
 
-    for book in library['books']:
-        book['bookId'] = str(book['bookId'])
+    if stream_format is not None:
+        return streaming.stream_response(stream_format, 'books', books, head=library, wrap='library')
+
+    library['books'] = list(books)
 
     return jsonify({
         'library': library
@@ -213,18 +246,7 @@ def create_library(user_id: str):
     result = db_provider.col_book_libraries.insert_one(new_library)
 
     if not is_private:
-        user = db_provider.col_users.find_one({'_id': ObjectId(user_id)})
-
-        db_provider.col_feed.insert_one({
-            'issuerUserId': ObjectId(user_id),
-            'issuerNameSurname': user['nameSurname'],
-            'issuedAt': datetime.now(),
-            'type': 'bookListPublish',
-            'details': {
-                'bookListId': result.inserted_id,
-                'bookListName': title
-            }
-        })
+        _publish_library(user_id, result.inserted_id, title)
 
     return jsonify({
         'libraryId': str(result.inserted_id)
@@ -256,29 +278,19 @@ def update_library(user_id: str, library_id: str):
     if is_private is not None:
         updated_fields['isPrivate'] = is_private
 
-    result = db_provider.col_book_libraries.update_one({
+    library = db_provider.col_book_libraries.find_one_and_update({
         '_id': ObjectId(library_id),
         'authorId': ObjectId(user_id)
     }, {
         '$set': updated_fields
-    })
+    }, projection={'title': 1}, return_document=ReturnDocument.AFTER)
 
-    if result.matched_count == 0:
+    if library is None:
         return jsonify({'error': 'No library found'}), 404
 
-    if not is_private:
-        user = db_provider.col_users.find_one({'_id': ObjectId(user_id)})
-
-        db_provider.col_feed.insert_one({
-            'issuerUserId': ObjectId(user_id),
-            'issuerNameSurname': user['nameSurname'],
-            'issuedAt': datetime.now(),
-            'type': 'bookListPublish',
-            'details': {
-                'bookListId': result.inserted_id,
-                'bookListName': title
-            }
-        })
+    # Only announce libraries that have been made public with this update
+    if is_private is False:
+        _publish_library(user_id, library['_id'], library['title'])
 
     return jsonify({'message': 'Updated'}), 200
 
@@ -300,6 +312,8 @@ def delete_library(user_id: str, library_id: str):
     if result.deleted_count == 0:
         return jsonify({'error': 'No library found'}), 404
 
+    owned_books.invalidate_owned_books(ObjectId(user_id))
+
     return jsonify({'message': 'Deleted'}), 200
 
 
@@ -315,24 +329,31 @@ def add_book_to_library(user_id: str, library_id: str):
     if not ObjectId.is_valid(book_id):
         return jsonify({'error': 'Invalid bookId'}), 400
 
+    # The summary is stored next to the book, so listing the library needs no join
+    book_summary = book_summaries.get_book_summary(ObjectId(book_id))
+
+    if book_summary is None:
+        return jsonify({'error': 'No book found'}), 404
+
+    update = {
+        '$addToSet': {
+            'books': ObjectId(book_id)
+        },
+        '$set': {
+            f'bookSummaries.{ObjectId(book_id)}': book_summary
+        }
+    }
+
     if library_id != "_likedBooks":
         result = db_provider.col_book_libraries.update_one({
             '_id': ObjectId(library_id),
             'authorId': ObjectId(user_id)
-        }, {
-            '$addToSet': {
-                'books': ObjectId(book_id)
-            }
-        })
+        }, update)
     else:
         result = db_provider.col_book_libraries.update_one({
             'authorId': ObjectId(user_id),
             'title': '_likedBooks'
-        }, {
-            '$addToSet': {
-                'books': ObjectId(book_id)
-            }
-        })
+        }, update)
 
         # Update user's pool based on the liked book's category
         pool_ops.add_weight_to_category(user_id, book_id)
@@ -340,6 +361,8 @@ def add_book_to_library(user_id: str, library_id: str):
     if result.matched_count == 0:
         return jsonify({'error': 'No library found'}), 404
 
+    owned_books.add_owned_book(ObjectId(user_id), ObjectId(book_id))
+
     return jsonify({'message': 'Added'}), 200
 
 
@@ -362,6 +385,9 @@ def remove_book_from_library(user_id: str, library_id: str):
         }, {
             '$pull': {
                 'books': ObjectId(book_id)
+            },
+            '$unset': {
+                f'bookSummaries.{ObjectId(book_id)}': ''
             }
         })
     else:
@@ -371,10 +397,15 @@ def remove_book_from_library(user_id: str, library_id: str):
         }, {
             '$pull': {
                 'books': ObjectId(book_id)
+            },
+            '$unset': {
+                f'bookSummaries.{ObjectId(book_id)}': ''
             }
         })
 
     if result.matched_count == 0:
         return jsonify({'error': 'No library found'}), 404
 
+    owned_books.invalidate_owned_books(ObjectId(user_id))
+
     return jsonify({'message': 'Removed'}), 200
@@ -2,6 +2,7 @@ from bson import ObjectId
 from flask import Blueprint, request, jsonify
 
 from services.database import db_provider
+from utils import book_summaries, owned_books, streaming
 from utils.flask_auth import login_required
 
 bp = Blueprint('book_tracking', __name__)
@@ -15,63 +16,48 @@ def get_book_track_datas(user_id: str):
     if query_book_id is not None and not ObjectId.is_valid(query_book_id):
         return jsonify({'error': 'Invalid bookId'}), 400
 
-    aggregation_pipeline = [
-        {
-            '$lookup': {
-                'from': 'rawBookDatas',
-                'localField': 'bookId',
-                'foreignField': '_id',
-                'as': 'bookData'
-            }
-        }, {
-            '$unwind': {
-                'path': '$bookData',
-                'preserveNullAndEmptyArrays': False
-            }
-        }, {
-            '$project': {
-                '_id': 0,
-                'bookId': 1,
-                'status': 1,
-                'bookTitle': '$bookData.volumeInfo.title',
-                'bookAuthors': '$bookData.volumeInfo.authors',
-                'bookThumbnailUrl': '$bookData.volumeInfo.imageLinks.thumbnail'
-            }
-        }
-    ]
-
-    def _convert_object_id_to_string(doc):
-        doc['bookId'] = str(doc['bookId'])
+    # The book summaries are stored in the tracking statuses, so no join is needed
+    projection = {
+        '_id': 0,
+        'bookId': 1,
+        'status': 1,
+        'bookSummary': 1
+    }
+
+    def _convert_to_api_output(doc):
+        summary = doc.pop('bookSummary')
+
+        doc['bookTitle'] = summary.get('title')
+        doc['bookAuthors'] = summary.get('authors')
+        doc['bookThumbnailUrl'] = summary.get('thumbnail')
         return doc
 
     if query_book_id is not None:
-        aggregation_pipeline.insert(0, {
-            '$match': {
-                'ownerUserId': ObjectId(user_id),
-                'bookId': ObjectId(query_book_id)
-            }
-        })
-
-        data = db_provider.col_book_tracking_statuses.aggregate(aggregation_pipeline)
-        data_converted = list(map(_convert_object_id_to_string, data))
+        data = db_provider.col_book_tracking_statuses.find_one({
+            'ownerUserId': ObjectId(user_id),
+            'bookId': ObjectId(query_book_id),
+            'bookSummary': {'$exists': True}
+        }, projection=projection)
 
-        if len(data_converted) == 0:
+        if data is None:
             return jsonify({'error': 'No data found'}), 404
 
         return jsonify({
-            "data": data_converted[0]
+            "data": _convert_to_api_output(data)
         }), 200
 
-    aggregation_pipeline.insert(0, {
-        '$match': {
-            'ownerUserId': ObjectId(user_id),
-        },
-    })
+    datas = db_provider.col_book_tracking_statuses.find({
+        'ownerUserId': ObjectId(user_id),
+        'bookSummary': {'$exists': True}
+    }, projection=projection, batch_size=streaming.STREAM_BATCH_SIZE)
 
-    datas = db_provider.col_book_tracking_statuses.aggregate(aggregation_pipeline)
+    stream_format = streaming.get_stream_format()
+
+    if stream_format is not None:
+        return streaming.stream_response(stream_format, 'datas', map(_convert_to_api_output, datas))
 
     return jsonify({
-        "datas": list(map(_convert_object_id_to_string, datas))
+        "datas": list(map(_convert_to_api_output, datas))
     }), 200
 
 
@@ -89,13 +75,21 @@ def patch_book_track_datas(user_id: str):
         if new_status not in ['willRead', 'reading', 'completed', 'dropped']:
             return jsonify({'error': 'Invalid status argument'}), 400
 
+        # The summary is stored next to the book, so listing the statuses needs no join
+        book_summary = book_summaries.get_book_summary(ObjectId(book_id))
+
+        if book_summary is None:
+            return jsonify({'error': 'No book found'}), 404
+
         db_provider.col_book_tracking_statuses.update_one({
             'ownerUserId': ObjectId(user_id),
             'bookId': ObjectId(data.get('bookId'))
         }, {
-            '$set': {'status': new_status}
+            '$set': {'status': new_status, 'bookSummary': book_summary}
         }, upsert=True)
 
+        owned_books.add_owned_book(ObjectId(user_id), ObjectId(book_id))
+
         return jsonify({'message': 'Updated'}), 200
 
     db_provider.col_book_tracking_statuses.delete_one({
@@ -103,4 +97,6 @@ def patch_book_track_datas(user_id: str):
         'bookId': ObjectId(data.get('bookId'))
     })
 
+    owned_books.invalidate_owned_books(ObjectId(user_id))
+
     return jsonify({'message': 'Deleted'}), 200
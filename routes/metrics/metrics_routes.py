@@ -0,0 +1,37 @@
+from hmac import compare_digest
+from os import environ
+
+from flask import Blueprint, jsonify, request
+
+from services.database import db_provider
+from utils.book_cache import book_cache
+from utils.compression import compressed_body_cache
+from utils.owned_books import owned_books_cache
+from utils.token_management import verified_token_cache_stats
+
+bp = Blueprint("metrics", __name__)
+
+# The endpoint is disabled unless a token is set
+METRICS_TOKEN = environ.get("METRICS_TOKEN")
+
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics_route():
+    if not METRICS_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+
+    authorization = request.headers.get("Authorization", "")
+
+    # Bytes are compared, since compare_digest rejects strings with non-ASCII characters
+    if not compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        return jsonify({"error": "Invalid metrics token"}), 401
+
+    return jsonify({
+        "mongoCommands": db_provider.command_metrics.snapshot(),
+        "caches": {
+            "books": book_cache.stats(),
+            "compressedBodies": compressed_body_cache.stats(),
+            "ownedBooks": owned_books_cache.stats(),
+            "verifiedTokens": verified_token_cache_stats()
+        }
+    }), 200
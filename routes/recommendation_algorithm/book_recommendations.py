@@ -1,8 +1,9 @@
+from bson import ObjectId
 from flask import Blueprint, jsonify, request
 
 from models.book_categories import BookCategory
-from services.database import db_provider
-from utils import pool_ops
+from utils import book_sampling, owned_books, pool_ops
+from utils.concurrency import run_concurrently
 from utils.flask_auth import login_required
 
 bp = Blueprint("book_recommendations", __name__)
@@ -13,77 +14,33 @@ bp = Blueprint("book_recommendations", __name__)
 def get_recommendations(user_id: str):
     param_category_filter = request.args.get("category")
 
-    filters = {
-        "volumeInfo.maturityRating": {
-            "$ne": "MATURE"
-        },
-        "volumeInfo.description": {
-            "$exists": True,
-            "$ne": ""
-        }
-    }
+    if param_category_filter is not None and param_category_filter not in list(map(str, BookCategory)):
+        return jsonify({
+            "error": f"Invalid category '{param_category_filter}'"
+        }), 400
 
     result = None
+    co_liked_result = []
 
-    if param_category_filter is not None:
-        if param_category_filter not in list(map(str, BookCategory)):
-            return jsonify({
-                "error": f"Invalid category '{param_category_filter}'"
-            }), 400
-
-        filters["category"] = param_category_filter
+    # Books the user already has in a library or tracks are not recommended
+    owned = owned_books.get_owned_book_ids(ObjectId(user_id))
 
-        result = db_provider.col_raw_book_datas.aggregate([
-            {
-                "$match": filters
-            },
-            {
-                "$sample": {
-                    "size": 10
-                }
-            },
-            {
-                "$project": {
-                    "bookId": "$_id",
-                    "_id": 0,
-                    "title": "$volumeInfo.title",
-                    "authors": "$volumeInfo.authors",
-                    "description": "$volumeInfo.description",
-                    "thumbnail": "$volumeInfo.imageLinks.thumbnail"
-                }
-            }
-        ])
+    if param_category_filter is not None:
+        result = book_sampling.sample_eligible_books(10, category=param_category_filter, exclude=owned)
     else:
-        result = pool_ops.get_personalized_recommendations(user_id)
+        # Personalized sampling runs queries concurrently itself, so it goes first, on this thread
+        result, co_liked_result = run_concurrently(
+            lambda: pool_ops.get_personalized_recommendations(user_id, exclude=owned),
+            lambda: pool_ops.get_co_liked_recommendations(user_id, exclude=owned)
+        )
 
     if result is None:
         # Get random books
-        result = db_provider.col_raw_book_datas.aggregate([
-            {
-                "$match": filters
-            },
-            {
-                "$sample": {
-                    "size": 10
-                }
-            },
-            {
-                "$project": {
-                    "bookId": "$_id",
-                    "_id": 0,
-                    "title": "$volumeInfo.title",
-                    "authors": "$volumeInfo.authors",
-                    "description": "$volumeInfo.description",
-                    "thumbnail": "$volumeInfo.imageLinks.thumbnail"
-                }
-            }
-        ])
-
-    def _convert_id_to_str(doc):
-        doc["bookId"] = str(doc["bookId"])
-        return doc
+        result = book_sampling.sample_eligible_books(10, exclude=owned)
 
-    result = list(map(_convert_id_to_str, result))
+    if co_liked_result:
+        # Mix in the books liked together with the user's likes
+        result = pool_ops.blend_recommendations(result, co_liked_result)
 
     return jsonify({
         "recommendations": result
@@ -3,6 +3,7 @@ from bson.errors import InvalidId
 from flask import Blueprint, jsonify, request
 
 from services.database import db_provider
+from utils import timeline_ops
 from utils.flask_auth import login_required
 
 bp = Blueprint("user_data_fetching", __name__)
@@ -54,6 +55,8 @@ def follow_user_route(user_id: str):
         {"$addToSet": {"followedUsers": target_user_id}}
     )
 
+    timeline_ops.on_follow(user_id, target_user_id)
+
     return jsonify({"message": "User followed successfully"}), 200
 
 
@@ -75,6 +78,8 @@ def unfollow_user_route(user_id: str):
         {"$pull": {"followedUsers": target_user_id}}
     )
 
+    timeline_ops.on_unfollow(user_id, target_user_id)
+
     return jsonify({"message": "User unfollowed successfully"}), 200
 
 
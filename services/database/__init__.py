@@ -1,7 +1,9 @@
+from services.database._cli import db_cli
 from services.database._db_service import DatabaseServiceProvider
 
 db_provider = DatabaseServiceProvider()
 
 __all__ = [
-    "db_provider"
+    "db_cli",
+    "db_provider",
 ]
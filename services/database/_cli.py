@@ -0,0 +1,44 @@
+import click
+from flask.cli import AppGroup
+
+db_cli = AppGroup("db", help="Database index and migration commands.")
+
+
+@db_cli.command("migrate")
+def migrate_command():
+    """Apply pending migrations and create missing indexes."""
+
+    from services.database import db_provider
+
+    applied = db_provider.run_migrations()
+    created = db_provider.ensure_indexes()
+
+    click.echo(f"Applied migrations: {applied or 'none'}")
+    click.echo(f"Created indexes: {created or 'none'}")
+
+
+@db_cli.command("check-indexes")
+def check_indexes_command():
+    """Report missing, mismatched and extra indexes, exiting with 1 if any index is missing or mismatched."""
+
+    from services.database import db_provider
+
+    report = db_provider.check_indexes()
+    has_missing = False
+
+    for collection_name, result in report.items():
+        for name in result["missing"]:
+            has_missing = True
+            click.echo(f"missing  {collection_name}.{name}")
+
+        for name in result["mismatched"]:
+            has_missing = True
+            click.echo(f"mismatch {collection_name}.{name}")
+
+        for name in result["extra"]:
+            click.echo(f"extra    {collection_name}.{name}")
+
+    if has_missing:
+        raise SystemExit(1)
+
+    click.echo("All declared indexes exist")
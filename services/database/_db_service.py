@@ -1,33 +1,298 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
 from os import environ
+from threading import Event, Lock, Thread
 
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+from services.database._indexes import INDEX_REGISTRY
+from services.database._instrumentation import CommandMetricsListener
+from services.database._migrations import MIGRATIONS, Migration
+
+# Connections the pool opens in the background as soon as the client is created
+MONGO_MIN_POOL_SIZE = int(environ.get("MONGO_MIN_POOL_SIZE", 0))
+
+# A migration claimed by a worker that stopped renewing its lease for this long is taken over by another one
+MIGRATION_LEASE_SECONDS = int(environ.get("MIGRATION_LEASE_SECONDS", 60))
+MIGRATION_POLL_INTERVAL = 1
 
 
 # TODO: Using raw book datas for now, will be modified later
 class DatabaseServiceProvider:
-    _client: MongoClient
-    _db: Database
-    col_users: Collection
-    col_raw_book_datas: Collection
-    col_book_libraries: Collection
-    col_book_tracking_statuses: Collection
-    col_feed: Collection
-    col_pools: Collection
+    """Provides the MongoDB collections of the application.
+
+    The ``MongoClient`` is created lazily on the first collection access, and again
+    in every forked child process, since a client must not be shared across a fork.
+    Pre-forking servers can therefore import the application, and even query the
+    database, before forking their workers.
+    """
+
+    command_metrics: CommandMetricsListener
 
     def __init__(self):
-        mongo_url = environ.get("MONGO_URL")
+        self.command_metrics = CommandMetricsListener()
+
+        self._client: MongoClient | None = None
+        self._db: Database | None = None
+        self._client_pid: int | None = None
+        self._connect_lock = Lock()
+
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+
+    def _get_db(self) -> Database:
+        if self._db is not None and self._client_pid == os.getpid():
+            return self._db
+
+        with self._connect_lock:
+            if self._db is None or self._client_pid != os.getpid():
+                mongo_url = environ.get("MONGO_URL")
+
+                assert mongo_url is not None, "MONGO_URL env variable must be set"
+
+                # noinspection SpellCheckingInspection
+                self._client = MongoClient(
+                    mongo_url,
+                    event_listeners=[self.command_metrics],
+                    minPoolSize=MONGO_MIN_POOL_SIZE
+                )
+                self._db = self._client["database"]
+                self._client_pid = os.getpid()
+
+        return self._db
+
+    def reset_after_fork(self):
+        """Forget the client inherited from the parent process
+
+        It is registered with ``os.register_at_fork``, so it only needs to be
+        called manually by servers that create workers in other ways.
+        The parent's client is not closed, since its sockets still belong to the parent.
+        """
+
+        self._client = None
+        self._db = None
+        self._client_pid = None
+        self._connect_lock = Lock()
+
+    def ping(self):
+        """Connect to the database, if not connected yet, and check that it responds"""
+
+        self._get_db().command("ping")
+
+    @property
+    def col_users(self) -> Collection:
+        return self._get_db()["users"]
+
+    @property
+    def col_raw_book_datas(self) -> Collection:
+        return self._get_db()["rawBookDatas"]
+
+    @property
+    def col_book_summaries(self) -> Collection:
+        return self._get_db()["bookSummaries"]
+
+    @property
+    def col_book_libraries(self) -> Collection:
+        return self._get_db()["bookLibraries"]
+
+    @property
+    def col_book_tracking_statuses(self) -> Collection:
+        return self._get_db()["bookTrackingStatuses"]
+
+    @property
+    def col_feed(self) -> Collection:
+        return self._get_db()["feed"]
+
+    @property
+    def col_pools(self) -> Collection:
+        return self._get_db()["pools"]
+
+    @property
+    def col_timelines(self) -> Collection:
+        return self._get_db()["timelines"]
+
+    @property
+    def col_similar_books(self) -> Collection:
+        return self._get_db()["similarBooks"]
+
+    @property
+    def col_co_liked_books(self) -> Collection:
+        return self._get_db()["coLikedBooks"]
+
+    @property
+    def col_job_checkpoints(self) -> Collection:
+        return self._get_db()["jobCheckpoints"]
+
+    @property
+    def col_migrations(self) -> Collection:
+        return self._get_db()["migrations"]
+
+    def ensure_indexes(self) -> list[str]:
+        """Create the indexes declared in ``INDEX_REGISTRY`` that are missing
+
+        Existing indexes are left untouched, so it is safe to call this on every startup.
+        Since MongoDB 4.2, index builds only hold an exclusive lock at their start
+        and end, so reads and writes keep being served while an index is built.
+
+        Returns
+        -------
+        list[str]
+            The names of the created indexes, as ``<collection>.<index>``
+        """
+
+        created = []
+
+        for collection_name, missing in self.check_indexes(report_extra=False).items():
+            models = [
+                model for model in INDEX_REGISTRY[collection_name]
+                if model.document["name"] in missing["missing"]
+            ]
+
+            if not models:
+                continue
+
+            names = self._get_db()[collection_name].create_indexes(models)
+            created.extend(f"{collection_name}.{name}" for name in names)
+
+        return created
+
+    def check_indexes(self, report_extra: bool = True) -> dict[str, dict[str, list[str]]]:
+        """Compare the existing indexes with ``INDEX_REGISTRY``
+
+        Indexes are matched by name, and an existing index whose keys or uniqueness differ
+        from its declaration is reported as mismatched. It has to be dropped to be created again.
+
+        Parameters
+        ----------
+        report_extra: bool
+            Whether to report indexes that exist but are not declared in the registry
+
+        Returns
+        -------
+        dict[str, dict[str, list[str]]]
+            Missing, mismatched and extra index names per collection, e.g.
+            ``{"users": {"missing": ["email_1"], "mismatched": [], "extra": []}}``
+        """
+
+        report = {}
+        collection_names = set(INDEX_REGISTRY)
+
+        if report_extra:
+            collection_names |= set(self._get_db().list_collection_names())
+
+        for collection_name in sorted(collection_names):
+            declared = {
+                model.document["name"]: model.document for model in INDEX_REGISTRY.get(collection_name, [])
+            }
+            existing = self._get_db()[collection_name].index_information()
+            existing.pop("_id_", None)
+
+            mismatched = [
+                name for name, document in declared.items()
+                if name in existing and (
+                    list(document["key"].items()) != list(existing[name]["key"])
+                    or document.get("unique", False) != existing[name].get("unique", False)
+                )
+            ]
+
+            report[collection_name] = {
+                "missing": sorted(declared.keys() - existing.keys()),
+                "mismatched": sorted(mismatched),
+                "extra": sorted(existing.keys() - declared.keys()) if report_extra else []
+            }
+
+        return report
+
+    def _claim_migration(self, migration: Migration) -> bool:
+        now = datetime.now(tz=timezone.utc)
+
+        try:
+            # Matches an unfinished migration whose lease expired, e.g. since its worker crashed
+            self.col_migrations.find_one_and_update(
+                {
+                    "_id": migration.version,
+                    "finishedAt": None,
+                    "$or": [{"leaseExpiresAt": {"$lt": now}}, {"leaseExpiresAt": {"$exists": False}}]
+                },
+                {"$set": {
+                    "description": migration.description,
+                    "startedAt": now,
+                    "leaseExpiresAt": now + timedelta(seconds=MIGRATION_LEASE_SECONDS)
+                }},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Finished, or claimed by another worker whose lease is still valid
+            return False
+
+        return True
+
+    def _renew_migration_lease(self, version: int, stop: Event):
+        while not stop.wait(MIGRATION_LEASE_SECONDS / 3):
+            self.col_migrations.update_one(
+                {"_id": version},
+                {"$set": {"leaseExpiresAt": datetime.now(tz=timezone.utc) + timedelta(seconds=MIGRATION_LEASE_SECONDS)}}
+            )
+
+    def _apply_migration(self, migration: Migration):
+        stop_renewing = Event()
+        renewer = Thread(
+            target=self._renew_migration_lease,
+            args=(migration.version, stop_renewing),
+            name="migration-lease",
+            daemon=True
+        )
+        renewer.start()
+
+        try:
+            migration.apply(self._get_db())
+        except Exception:
+            stop_renewing.set()
+            renewer.join()
+
+            # Release the claim so that the migration is retried right away
+            self.col_migrations.delete_one({"_id": migration.version})
+            raise
+
+        stop_renewing.set()
+        renewer.join()
+
+        self.col_migrations.update_one(
+            {"_id": migration.version},
+            {"$set": {"finishedAt": datetime.now(tz=timezone.utc)}, "$unset": {"leaseExpiresAt": ""}}
+        )
+
+    def run_migrations(self) -> list[int]:
+        """Apply the migrations that have not been applied to the database yet
+
+        Each migration is claimed with a lease of ``MIGRATION_LEASE_SECONDS`` in the ``migrations`` collection,
+        which is renewed while it runs. Other workers wait for it to finish before going on with the next
+        migrations, so they never see a partially migrated database. A claim whose lease expired,
+        e.g. since its worker crashed, is taken over and the migration is applied again.
+
+        Returns
+        -------
+        list[int]
+            The versions of the migrations applied by this call
+        """
+
+        applied = []
+
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            while True:
+                if self._claim_migration(migration):
+                    self._apply_migration(migration)
+                    applied.append(migration.version)
+                    break
+
+                claim = self.col_migrations.find_one({"_id": migration.version}, projection={"finishedAt": 1})
 
-        assert mongo_url is not None, "MONGO_URL env variable must be set"
+                if claim is not None and claim.get("finishedAt") is not None:
+                    break
 
-        # noinspection SpellCheckingInspection
-        self._client = MongoClient(mongo_url)
-        self._db = self._client["database"]
+                time.sleep(MIGRATION_POLL_INTERVAL)
 
-        self.col_users = self._db["users"]
-        self.col_raw_book_datas = self._db["rawBookDatas"]
-        self.col_book_libraries = self._db["bookLibraries"]
-        self.col_book_tracking_statuses = self._db["bookTrackingStatuses"]
-        self.col_feed = self._db["feed"]
-        self.col_pools = self._db["pools"]
+        return applied
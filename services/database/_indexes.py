@@ -0,0 +1,37 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Declarative list of the indexes every collection must have, keyed by collection name.
+# Index names are generated by MongoDB from the keys, e.g. "email_1",
+# and are used to compare the registry against the existing indexes.
+INDEX_REGISTRY: dict[str, list[IndexModel]] = {
+    "users": [
+        # Registration relies on DuplicateKeyError for already used emails
+        IndexModel([("email", ASCENDING)], unique=True),
+        # Follower lookup for fanning feed entries out to timelines
+        IndexModel([("followedUsers", ASCENDING)]),
+    ],
+    "bookSummaries": [
+        # Random sampling of recommendable books, see utils.book_sampling
+        IndexModel([("category", ASCENDING), ("eligible", ASCENDING), ("randKey", ASCENDING)]),
+        IndexModel([("eligible", ASCENDING), ("randKey", ASCENDING)]),
+    ],
+    "bookLibraries": [
+        IndexModel([("authorId", ASCENDING), ("title", ASCENDING)]),
+        # Refreshing the stored summaries of a book, see utils.book_summaries
+        IndexModel([("books", ASCENDING)]),
+    ],
+    "bookTrackingStatuses": [
+        IndexModel([("ownerUserId", ASCENDING), ("bookId", ASCENDING)], unique=True),
+        # Refreshing the stored summaries of a book, see utils.book_summaries
+        IndexModel([("bookId", ASCENDING)]),
+    ],
+    "pools": [
+        IndexModel([("userId", ASCENDING)], unique=True),
+    ],
+    "feed": [
+        # Global feed, sorted by (issuedAt, _id) descending for keyset pagination
+        IndexModel([("issuedAt", DESCENDING), ("_id", DESCENDING)]),
+        # Followed users' feed, equality on issuer first, then the sort keys
+        IndexModel([("issuerUserId", ASCENDING), ("issuedAt", DESCENDING), ("_id", DESCENDING)]),
+    ],
+}
@@ -0,0 +1,188 @@
+import json
+import logging
+import random
+from bisect import bisect_left
+from os import environ
+from threading import Lock
+
+import bson
+from flask import has_request_context, request
+from pymongo import monitoring
+
+slow_query_logger = logging.getLogger("bookfinder.slow_queries")
+
+# Commands that take at least this long are written to the slow query log
+SLOW_QUERY_MS = float(environ.get("SLOW_QUERY_MS", 100))
+
+# Portion of the commands and replies whose BSON size is measured, the byte counts are extrapolated from them
+PAYLOAD_SIZE_SAMPLE_RATE = float(environ.get("PAYLOAD_SIZE_SAMPLE_RATE", 0.1))
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Fields added by the driver that say nothing about the query itself
+_DRIVER_FIELDS = {"$db", "lsid", "$clusterTime", "$readPreference", "txnNumber", "apiVersion"}
+
+
+def _redact(value):
+    """Replace every literal value of a command with ``"?"``, keeping its structure"""
+
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items()}
+
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+
+    # Field paths like "$volumeInfo.title" are part of the query shape, not data
+    if isinstance(value, str) and value.startswith("$"):
+        return value
+
+    return "?"
+
+
+def _collection_name(command_name: str, command: dict) -> str | None:
+    if command_name == "getMore":
+        return command.get("collection")
+
+    collection = command.get(command_name)
+
+    return collection if isinstance(collection, str) else None
+
+
+def _estimate_size(document: dict) -> int:
+    """Estimate the BSON size of a document, measuring it only for a sample of the calls"""
+
+    if random.random() >= PAYLOAD_SIZE_SAMPLE_RATE:
+        return 0
+
+    return round(len(bson.encode(document)) / PAYLOAD_SIZE_SAMPLE_RATE)
+
+
+def _document_count(reply: dict) -> int:
+    cursor = reply.get("cursor")
+
+    if cursor is not None:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+
+    return reply.get("n", 0)
+
+
+class _CommandMetrics:
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.documents = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "totalMs": round(self.total_ms, 3),
+            "documents": self.documents,
+            "bytesSent": self.bytes_sent,
+            "bytesReceived": self.bytes_received,
+            "latencyHistogramMs": {
+                **{f"le{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.bucket_counts)},
+                "inf": self.bucket_counts[-1]
+            }
+        }
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Collects per-command, per-collection latency, document and payload size metrics.
+
+    Commands slower than ``SLOW_QUERY_MS`` are logged to the ``bookfinder.slow_queries``
+    logger as JSON lines with the redacted command and the route that issued it.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics: dict[tuple[str, str | None], _CommandMetrics] = {}
+
+        # (connection id, request id) -> (command name, collection, route, redacted command)
+        self._in_flight: dict[tuple, tuple] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = event.command
+        collection = _collection_name(event.command_name, command)
+        route = request.endpoint if has_request_context() else None
+        shape = {key: value for key, value in command.items() if key not in _DRIVER_FIELDS}
+
+        # Encoding happens outside the lock, so other threads' commands are not held up by it
+        size = _estimate_size(command)
+
+        with self._lock:
+            self._in_flight[(event.connection_id, event.request_id)] = (
+                event.command_name, collection, route, shape
+            )
+
+            metrics = self._get_metrics(event.command_name, collection)
+            metrics.bytes_sent += size
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, reply=event.reply)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, reply=None)
+
+    def _get_metrics(self, command_name: str, collection: str | None) -> _CommandMetrics:
+        metrics = self._metrics.get((command_name, collection))
+
+        if metrics is None:
+            metrics = self._metrics[(command_name, collection)] = _CommandMetrics()
+
+        return metrics
+
+    def _finish(self, event, reply: dict | None):
+        duration_ms = event.duration_micros / 1000
+        size = _estimate_size(reply) if reply is not None else 0
+
+        with self._lock:
+            in_flight = self._in_flight.pop((event.connection_id, event.request_id), None)
+
+            if in_flight is None:
+                return
+
+            command_name, collection, route, shape = in_flight
+            metrics = self._get_metrics(command_name, collection)
+
+            metrics.count += 1
+            metrics.total_ms += duration_ms
+            metrics.bucket_counts[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+
+            if reply is None:
+                metrics.failures += 1
+            else:
+                metrics.documents += _document_count(reply)
+                metrics.bytes_received += size
+
+        if duration_ms >= SLOW_QUERY_MS:
+            slow_query_logger.warning(json.dumps({
+                "command": command_name,
+                "collection": collection,
+                "durationMs": round(duration_ms, 3),
+                "failed": reply is None,
+                "route": route,
+                "query": _redact(shape)
+            }, default=str))
+
+    def snapshot(self) -> list[dict]:
+        """Get the collected metrics
+
+        Returns
+        -------
+        list[dict]
+            The metrics of every command and collection pair, slowest in total first
+        """
+
+        with self._lock:
+            items = [
+                {"command": command_name, "collection": collection, **metrics.to_dict()}
+                for (command_name, collection), metrics in self._metrics.items()
+            ]
+
+        return sorted(items, key=lambda item: item["totalMs"], reverse=True)
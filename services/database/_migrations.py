@@ -0,0 +1,134 @@
+from dataclasses import dataclass
+from typing import Callable
+
+from pymongo.database import Database
+
+
+@dataclass
+class Migration:
+    """Represents a versioned, one-time change to the database.
+
+    Migrations are applied in ascending ``version`` order and recorded in the
+    ``migrations`` collection, so each of them runs only once per database.
+    Index definitions do not need a migration, they are kept in sync with
+    ``INDEX_REGISTRY`` on every run.
+    """
+
+    version: int
+    description: str
+    apply: Callable[[Database], None]
+
+
+def _remove_duplicates(db: Database, collection_name: str, keys: list[str]):
+    # Keeps the oldest document of each duplicate group, so that a unique index can be built
+    duplicate_groups = db[collection_name].aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": {key: f"${key}" for key in keys}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}}
+    ], allowDiskUse=True)
+
+    for group in duplicate_groups:
+        db[collection_name].delete_many({"_id": {"$in": group["ids"][1:]}})
+
+
+def _remove_upsert_duplicates(db: Database):
+    _remove_duplicates(db, "bookTrackingStatuses", ["ownerUserId", "bookId"])
+    _remove_duplicates(db, "pools", ["userId"])
+
+
+def _add_sampling_fields(db: Database):
+    # Superseded by the bookSummaries collection, which computes the same fields, see migration 4.
+    # Nothing reads them from rawBookDatas anymore, the version is kept so that it stays recorded.
+    pass
+
+
+# Kept in sync with utils.book_summaries.to_book_summary, which builds the summaries of newly added books
+_BOOK_SUMMARY_EXPRESSION = {
+    "title": "$book.volumeInfo.title",
+    "authors": "$book.volumeInfo.authors",
+    "thumbnail": "$book.volumeInfo.imageLinks.thumbnail",
+    "category": "$book.category"
+}
+
+
+def _add_book_summaries(db: Database):
+    # Both pipelines merge the summaries back into the documents they read, without leaving the server
+    db["bookTrackingStatuses"].aggregate([
+        {"$lookup": {"from": "rawBookDatas", "localField": "bookId", "foreignField": "_id", "as": "book"}},
+        {"$unwind": "$book"},
+        {"$project": {"bookSummary": _BOOK_SUMMARY_EXPRESSION}},
+        {"$merge": {"into": "bookTrackingStatuses", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ], allowDiskUse=True)
+
+    db["bookLibraries"].aggregate([
+        {"$project": {"books": 1}},
+        {"$unwind": "$books"},
+        {"$lookup": {"from": "rawBookDatas", "localField": "books", "foreignField": "_id", "as": "book"}},
+        {"$unwind": "$book"},
+        {"$group": {
+            "_id": "$_id",
+            "bookSummaries": {"$push": {"k": {"$toString": "$books"}, "v": _BOOK_SUMMARY_EXPRESSION}}
+        }},
+        {"$set": {"bookSummaries": {"$arrayToObject": "$bookSummaries"}}},
+        {"$merge": {"into": "bookLibraries", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+    ], allowDiskUse=True)
+
+
+def _build_book_summary_view(db: Database):
+    # Kept in sync with utils.book_summaries.BOOK_SUMMARY_VIEW_STAGES, which also refreshes the collection later
+    db["rawBookDatas"].aggregate([
+        {
+            "$project": {
+                "title": "$volumeInfo.title",
+                "authors": "$volumeInfo.authors",
+                "description": "$volumeInfo.description",
+                "thumbnail": "$volumeInfo.imageLinks.thumbnail",
+                "identifiers": "$volumeInfo.industryIdentifiers",
+                "category": 1,
+                "maturityRating": "$volumeInfo.maturityRating",
+                "hasDescription": {"$gt": [{"$strLenCP": {"$ifNull": ["$volumeInfo.description", ""]}}, 0]},
+                "randKey": {"$ifNull": ["$randKey", {"$rand": {}}]}
+            }
+        }, {
+            "$set": {
+                "eligible": {"$and": [{"$ne": ["$maturityRating", "MATURE"]}, "$hasDescription"]},
+                "refreshedAt": "$$NOW"
+            }
+        },
+        {"$merge": {"into": "bookSummaries", "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ], allowDiskUse=True)
+
+
+def _drop_library_membership_index(db: Database):
+    # Libraries containing a book are found from the user's libraries alone, which the (authorId, title) index serves
+    if "authorId_1_books_1" in db["bookLibraries"].index_information():
+        db["bookLibraries"].drop_index("authorId_1_books_1")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        description="Remove duplicate tracking statuses and pools created by concurrent upserts",
+        apply=_remove_upsert_duplicates
+    ),
+    Migration(
+        version=2,
+        description="Add the random sampling key and the eligibility flag to books",
+        apply=_add_sampling_fields
+    ),
+    Migration(
+        version=3,
+        description="Store the summaries of the books in the libraries and tracking statuses",
+        apply=_add_book_summaries
+    ),
+    Migration(
+        version=4,
+        description="Build the bookSummaries collection that the hot read paths use instead of rawBookDatas",
+        apply=_build_book_summary_view
+    ),
+    Migration(
+        version=5,
+        description="Drop the unused (authorId, books) index of bookLibraries",
+        apply=_drop_library_membership_index
+    ),
+]
@@ -0,0 +1,7 @@
+from services.recommendation._eligible_book_pools import EligibleBookPools
+
+eligible_book_pools = EligibleBookPools()
+
+__all__ = [
+    "eligible_book_pools",
+]
@@ -0,0 +1,145 @@
+import logging
+import os
+import time
+from os import environ
+from threading import Lock, Thread
+
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from services.database import db_provider
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_POOL_REFRESH_INTERVAL = int(environ.get("RECOMMENDATION_POOL_REFRESH_INTERVAL", 600))
+
+# Extra books drawn to replace the excluded ones, at most this many times the requested count
+RECOMMENDATION_MAX_OVERSAMPLE = 2
+
+# ObjectIds are stored as their 12 raw bytes. A void dtype is used since
+# bytes dtypes ("S12") drop trailing null bytes.
+_OBJECT_ID_DTYPE = np.dtype("V12")
+
+
+class EligibleBookPools:
+    """Keeps the ids of the recommendable books in memory, grouped by category.
+
+    Every category's ids are kept in a compact NumPy array, so picking random
+    books is done in-process without asking the database to sample.
+    The pools are built in a background thread when ``start`` is called and rebuilt
+    every ``RECOMMENDATION_POOL_REFRESH_INTERVAL`` seconds. Until the first build
+    finishes, ``is_ready`` is ``False`` and callers should sample in the database instead.
+    """
+
+    def __init__(self):
+        self._category_pools: dict[str, np.ndarray] = {}
+        self._all_books = np.empty(0, dtype=_OBJECT_ID_DTYPE)
+        self._ready = False
+        self._start_lock = Lock()
+        self._thread_pid: int | None = None
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The background thread doesn't exist in a forked child, the built pools are kept
+        self._start_lock = Lock()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._ready
+
+    def start(self):
+        """Start building and refreshing the pools in the background, if not done already in this process"""
+
+        if self._thread_pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                Thread(target=self._refresh_periodically, name="recommendation-pools", daemon=True).start()
+
+    def refresh(self):
+        """Rebuild the pools from the database"""
+
+        ids_by_category: dict[str, list[bytes]] = {}
+
+        books = db_provider.col_book_summaries.find({"eligible": True}, projection={"category": 1})
+
+        for book in books:
+            ids_by_category.setdefault(book.get("category"), []).append(book["_id"].binary)
+
+        category_pools = {
+            category: np.array(ids, dtype=_OBJECT_ID_DTYPE)
+            for category, ids in ids_by_category.items()
+        }
+
+        all_books = (
+            np.concatenate(list(category_pools.values()))
+            if category_pools else np.empty(0, dtype=_OBJECT_ID_DTYPE)
+        )
+
+        # Swap both at once, so draws never mix two builds
+        self._category_pools, self._all_books = category_pools, all_books
+        self._ready = True
+
+    def _refresh_periodically(self):
+        while True:
+            try:
+                self.refresh()
+            except PyMongoError:
+                logger.exception("Refreshing the recommendation pools failed")
+
+            time.sleep(RECOMMENDATION_POOL_REFRESH_INTERVAL)
+
+    def draw(
+            self,
+            category_counts: dict[str | None, int],
+            rng: np.random.Generator,
+            exclude: np.ndarray | None = None
+    ) -> list[ObjectId]:
+        """Pick distinct random book ids from the pools
+
+        Parameters
+        ----------
+        category_counts: dict[str | None, int]
+            How many books to pick from each category, ``None`` picks from every category
+        rng: np.random.Generator
+            The random generator to use
+        exclude: np.ndarray | None
+            Sorted raw ids of the books not to pick. Every category is oversampled by up to
+            ``RECOMMENDATION_MAX_OVERSAMPLE`` times its count, so excluded books leave no gaps.
+
+        Returns
+        -------
+        list[ObjectId]
+            The picked book ids, without duplicates
+        """
+
+        pools, all_books = self._category_pools, self._all_books
+        exclude_count = 0 if exclude is None else len(exclude)
+        picked = []
+
+        for category, count in category_counts.items():
+            pool = all_books if category is None else pools.get(category)
+
+            if pool is None or count <= 0 or len(pool) == 0:
+                continue
+
+            sample_size = min(count + min(exclude_count, count * RECOMMENDATION_MAX_OVERSAMPLE), len(pool))
+            sample = rng.choice(pool, size=sample_size, replace=False)
+
+            if exclude_count:
+                positions = np.minimum(np.searchsorted(exclude, sample), exclude_count - 1)
+                sample = sample[exclude[positions] != sample]
+
+            picked.append(sample[:count])
+
+        if not picked:
+            return []
+
+        # A book picked from its category can also be picked from every category
+        unique_ids = np.unique(np.concatenate(picked))
+
+        return [ObjectId(bytes(raw_id)) for raw_id in unique_ids]
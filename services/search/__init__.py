@@ -0,0 +1,13 @@
+from services.search._book_search_engine import BookSearchEngine
+from services.search._book_suggester import BookSuggester
+from services.search._normalization import normalize_text, tokenize
+
+book_search_engine = BookSearchEngine()
+book_suggester = BookSuggester()
+
+__all__ = [
+    "book_search_engine",
+    "book_suggester",
+    "normalize_text",
+    "tokenize",
+]
@@ -0,0 +1,164 @@
+import logging
+import os
+import time
+from os import environ
+from threading import Event, Lock, Thread
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from services.database import db_provider
+from services.search._text_index import TextIndex
+
+logger = logging.getLogger(__name__)
+
+# How often the index is rebuilt if the database does not support change streams
+SEARCH_REFRESH_INTERVAL = int(environ.get("SEARCH_REFRESH_INTERVAL", 600))
+
+_BOOK_PROJECTION = {
+    "volumeInfo.title": 1,
+    "volumeInfo.authors": 1,
+    "volumeInfo.imageLinks.thumbnail": 1
+}
+
+
+def _book_to_index_entry(book: dict) -> tuple[str, str, dict]:
+    volume_info = book.get("volumeInfo", {})
+    title = volume_info.get("title", "")
+    authors = volume_info.get("authors", [])
+
+    payload = {
+        "bookId": str(book["_id"]),
+        "title": title,
+        "thumbnail": volume_info.get("imageLinks", {}).get("thumbnail")
+    }
+
+    return str(book["_id"]), " ".join([title, *authors]), payload
+
+
+class BookSearchEngine:
+    """Searches book titles and authors with an in-process ``TextIndex``.
+
+    The index is built from ``rawBookDatas`` by a background thread, started by
+    ``start`` or by the first search. The thread opens the collection's change stream
+    before scanning the books, so the changes made during the build are applied after it,
+    and keeps the index up to date from then on. If change streams are not supported,
+    the index is rebuilt every ``SEARCH_REFRESH_INTERVAL`` seconds instead.
+    """
+
+    def __init__(self):
+        self._index = TextIndex()
+        self._ready = Event()
+        self._start_lock = Lock()
+        self._thread_pid: int | None = None
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The background thread doesn't exist in a forked child, the built index is kept until it's rebuilt
+        ready = self._ready.is_set()
+
+        self._ready = Event()
+        self._start_lock = Lock()
+        self._index.reset_lock()
+
+        if ready:
+            self._ready.set()
+
+    def start(self, wait: bool = False):
+        """Start building the index and following the changes, if not done already in this process
+
+        Parameters
+        ----------
+        wait: bool
+            Whether to wait until the index is built
+        """
+
+        if self._thread_pid != os.getpid():
+            with self._start_lock:
+                if self._thread_pid != os.getpid():
+                    self._thread_pid = os.getpid()
+                    Thread(target=self._follow_changes, name="book-search-sync", daemon=True).start()
+
+        if wait:
+            self._ready.wait()
+
+    def search(self, query: str, limit: int) -> list[dict]:
+        """Search books by title and authors
+
+        Waits for the index to be built if it's not built yet.
+
+        Parameters
+        ----------
+        query: str
+            The search query
+        limit: int
+            The maximum number of results
+
+        Returns
+        -------
+        list[dict]
+            The matching books with ``bookId``, ``title`` and ``thumbnail`` fields
+        """
+
+        self.start(wait=True)
+
+        return self._index.search(query, limit)
+
+    def update_book(self, book: dict):
+        """Add or replace a book in the index
+
+        Parameters
+        ----------
+        book: dict
+            The raw book document, at least with the ``volumeInfo`` title, authors and thumbnail
+        """
+
+        self._index.add_document(*_book_to_index_entry(book))
+
+    def remove_book(self, book_id: str):
+        """Remove a book from the index
+
+        Parameters
+        ----------
+        book_id: str
+            The id of the removed book
+        """
+
+        self._index.remove_document(book_id)
+
+    def _rebuild_index(self):
+        try:
+            # Build aside and swap, so searches are never served from a half-built index
+            self._index = TextIndex.build(
+                _book_to_index_entry(book)
+                for book in db_provider.col_raw_book_datas.find({}, projection=_BOOK_PROJECTION)
+            )
+        except PyMongoError:
+            logger.exception("Building the search index failed")
+        finally:
+            # Searches don't wait forever if the build failed, they are served from the previous index
+            self._ready.set()
+
+    def _follow_changes(self):
+        try:
+            with db_provider.col_raw_book_datas.watch(full_document="updateLookup") as stream:
+                # The stream was opened before the scan, so it replays the changes made during the build
+                self._rebuild_index()
+
+                for change in stream:
+                    if change["operationType"] in ("insert", "update", "replace"):
+                        if change.get("fullDocument") is not None:
+                            self.update_book(change["fullDocument"])
+                    elif change["operationType"] == "delete":
+                        self.remove_book(str(change["documentKey"]["_id"]))
+        except OperationFailure:
+            # Change streams are only available on replica sets and sharded clusters
+            logger.info("Change streams are not supported, rebuilding the search index periodically")
+        except PyMongoError:
+            logger.exception("Following book changes failed, rebuilding the search index periodically")
+
+        self._rebuild_index()
+
+        while True:
+            time.sleep(SEARCH_REFRESH_INTERVAL)
+            self._rebuild_index()
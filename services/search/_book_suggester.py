@@ -0,0 +1,127 @@
+import logging
+import os
+import time
+from os import environ
+from threading import Lock, Thread
+
+from pymongo.errors import PyMongoError
+
+from services.database import db_provider
+from services.search._normalization import normalize_text
+from services.search._prefix_index import PrefixIndex
+
+logger = logging.getLogger(__name__)
+
+# Suggestion settings
+SUGGEST_MAX_RESULTS = 10
+SUGGEST_REFRESH_INTERVAL = int(environ.get("SUGGEST_REFRESH_INTERVAL", 900))
+
+
+class BookSuggester:
+    """Suggests book titles for a typed prefix, most popular books first.
+
+    Suggestions are served from an in-memory ``PrefixIndex`` over normalized titles.
+    A book's popularity is the number of libraries and tracking statuses it appears in.
+    The index is built on the first lookup, or when ``start`` is called, and rebuilt
+    in the background every ``SUGGEST_REFRESH_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self._index = PrefixIndex([], SUGGEST_MAX_RESULTS)
+        self._start_lock = Lock()
+        self._started = False
+        self._thread_pid: int | None = None
+
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # The background thread doesn't exist in a forked child, the built index is kept
+        self._start_lock = Lock()
+
+    def start(self):
+        """Build the index and start the background refresh, if not done already in this process"""
+
+        if self._started and self._thread_pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if not self._started:
+                self._index = self._build_index()
+                self._started = True
+
+            if self._thread_pid != os.getpid():
+                self._thread_pid = os.getpid()
+                Thread(target=self._refresh_periodically, name="book-suggest-refresh", daemon=True).start()
+
+    def suggest(self, prefix: str, limit: int) -> list[dict]:
+        """Get the most popular books whose titles start with the prefix
+
+        Parameters
+        ----------
+        prefix: str
+            The typed prefix, it is normalized the same way as the titles
+        limit: int
+            The maximum number of suggestions, capped at ``SUGGEST_MAX_RESULTS``
+
+        Returns
+        -------
+        list[dict]
+            The suggested books with ``bookId``, ``title`` and ``thumbnail`` fields
+        """
+
+        self.start()
+
+        return self._index.lookup(normalize_text(prefix).lstrip(), limit)
+
+    @staticmethod
+    def _count_popularity() -> dict:
+        popularity = {}
+
+        library_counts = db_provider.col_book_libraries.aggregate([
+            {"$unwind": "$books"},
+            {"$group": {"_id": "$books", "count": {"$sum": 1}}}
+        ], allowDiskUse=True)
+
+        tracking_counts = db_provider.col_book_tracking_statuses.aggregate([
+            {"$group": {"_id": "$bookId", "count": {"$sum": 1}}}
+        ], allowDiskUse=True)
+
+        for counts in (library_counts, tracking_counts):
+            for count in counts:
+                popularity[count["_id"]] = popularity.get(count["_id"], 0) + count["count"]
+
+        return popularity
+
+    def _build_index(self) -> PrefixIndex:
+        popularity = self._count_popularity()
+        entries = []
+
+        books = db_provider.col_raw_book_datas.find({}, projection={
+            "volumeInfo.title": 1,
+            "volumeInfo.imageLinks.thumbnail": 1
+        })
+
+        for book in books:
+            volume_info = book.get("volumeInfo", {})
+            title = volume_info.get("title")
+
+            if not title:
+                continue
+
+            entries.append((normalize_text(title), popularity.get(book["_id"], 0), {
+                "bookId": str(book["_id"]),
+                "title": title,
+                "thumbnail": volume_info.get("imageLinks", {}).get("thumbnail")
+            }))
+
+        return PrefixIndex(entries, SUGGEST_MAX_RESULTS)
+
+    def _refresh_periodically(self):
+        while True:
+            time.sleep(SUGGEST_REFRESH_INTERVAL)
+
+            try:
+                # Build aside and swap, so lookups are never served from a half-built index
+                self._index = self._build_index()
+            except PyMongoError:
+                logger.exception("Rebuilding the suggestion index failed")
@@ -0,0 +1,43 @@
+import re
+import unicodedata
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Fold the case and strip the accents of a text
+
+    ``"Éléments de Géométrie"`` becomes ``"elements de geometrie"``.
+
+    Parameters
+    ----------
+    text: str
+        The text to normalize
+
+    Returns
+    -------
+    str
+        The normalized text
+    """
+
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+
+    return stripped.casefold()
+
+
+def tokenize(text: str) -> list[str]:
+    """Split a text into normalized tokens
+
+    Parameters
+    ----------
+    text: str
+        The text to tokenize
+
+    Returns
+    -------
+    list[str]
+        The normalized tokens, in the order they appear in the text
+    """
+
+    return _TOKEN_PATTERN.findall(normalize_text(text))
@@ -0,0 +1,96 @@
+import heapq
+from bisect import bisect_left
+
+# Ranges with at most this many keys are ranked by scanning them on each lookup.
+# Larger ranges get their top entries precomputed when the index is built.
+SCAN_LIMIT = 1024
+
+# Longer prefixes are always scanned, this bounds the build's recursion depth
+MAX_PRECOMPUTED_PREFIX_LENGTH = 32
+
+
+class PrefixIndex:
+    """Immutable prefix index that returns the most popular entries for a key prefix.
+
+    Keys are kept in one sorted list, so the entries sharing a prefix form a
+    contiguous range found with two binary searches. For prefixes that match
+    more than ``SCAN_LIMIT`` keys, the best entries are precomputed at build time,
+    so a lookup never ranks more than ``SCAN_LIMIT`` entries, except for prefixes
+    longer than ``MAX_PRECOMPUTED_PREFIX_LENGTH`` characters.
+    """
+
+    def __init__(self, entries: list[tuple[str, int, dict]], top_k: int):
+        """Build the index
+
+        Parameters
+        ----------
+        entries: list[tuple[str, int, dict]]
+            ``(key, popularity, payload)`` tuples, keys are expected to be normalized
+        top_k: int
+            The maximum number of entries that can be requested in a lookup
+        """
+
+        entries = sorted(entries, key=lambda entry: entry[0])
+
+        self._keys: list[str] = [entry[0] for entry in entries]
+        self._popularity: list[int] = [entry[1] for entry in entries]
+        self._payloads: list[dict] = [entry[2] for entry in entries]
+        self._top_k = top_k
+
+        # prefix -> positions of the most popular entries, for large ranges only
+        self._precomputed: dict[str, list[int]] = {}
+        self._precompute("", 0, len(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _top_positions(self, start: int, end: int, limit: int) -> list[int]:
+        return heapq.nlargest(limit, range(start, end), key=self._popularity.__getitem__)
+
+    def _precompute(self, prefix: str, start: int, end: int):
+        if end - start <= SCAN_LIMIT or len(prefix) > MAX_PRECOMPUTED_PREFIX_LENGTH:
+            return
+
+        self._precomputed[prefix] = self._top_positions(start, end, self._top_k)
+
+        # Keys equal to the prefix itself have no next character
+        position = start
+
+        while position < end and len(self._keys[position]) == len(prefix):
+            position += 1
+
+        # Split the range by the next character and recurse into each part
+        while position < end:
+            child_prefix = self._keys[position][:len(prefix) + 1]
+            child_end = bisect_left(self._keys, child_prefix + "\U0010ffff", lo=position, hi=end)
+
+            self._precompute(child_prefix, position, child_end)
+            position = child_end
+
+    def lookup(self, prefix: str, limit: int) -> list[dict]:
+        """Get the most popular entries whose keys start with the prefix
+
+        Parameters
+        ----------
+        prefix: str
+            The normalized key prefix
+        limit: int
+            The maximum number of entries, at most the ``top_k`` given at build time
+
+        Returns
+        -------
+        list[dict]
+            The payloads of the matching entries, most popular first
+        """
+
+        limit = min(limit, self._top_k)
+        precomputed = self._precomputed.get(prefix)
+
+        if precomputed is not None:
+            positions = precomputed[:limit]
+        else:
+            start = bisect_left(self._keys, prefix)
+            end = bisect_left(self._keys, prefix + "\U0010ffff", lo=start)
+            positions = self._top_positions(start, end, limit)
+
+        return [self._payloads[position] for position in positions]
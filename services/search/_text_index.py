@@ -0,0 +1,269 @@
+import heapq
+import math
+from bisect import bisect_left, insort
+from collections import Counter
+from threading import RLock
+from typing import Iterable
+
+from services.search._normalization import tokenize
+
+# BM25 settings
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Prefix matching settings
+MAX_PREFIX_EXPANSIONS = 64
+
+
+class TextIndex:
+    """In-memory inverted index with BM25 ranking.
+
+    Documents are identified by string keys and can be added, replaced and
+    removed one by one, so the index can be kept up to date incrementally.
+    The last query token is matched as a prefix, to support search-as-you-type.
+
+    All public methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+
+        # term -> {doc number -> term frequency}
+        self._postings: dict[str, dict[int, int]] = {}
+
+        # Sorted list of every term, used for prefix lookups with binary search
+        self._vocabulary: list[str] = []
+
+        self._doc_numbers: dict[str, int] = {}
+        self._doc_keys: dict[int, str] = {}
+        self._doc_terms: dict[int, Counter] = {}
+        self._doc_payloads: dict[int, dict] = {}
+        self._next_doc_number = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_numbers)
+
+    def reset_lock(self):
+        """Replace the lock, to be called in a forked child
+
+        Another thread of the parent may have held the lock during the fork,
+        and that thread doesn't exist in the child to release it.
+        """
+
+        self._lock = RLock()
+
+    @classmethod
+    def build(cls, documents: Iterable[tuple[str, str, dict]]) -> "TextIndex":
+        """Build an index from many documents at once
+
+        The sorted vocabulary is built once at the end, instead of inserting every new term into it.
+
+        Parameters
+        ----------
+        documents: Iterable[tuple[str, str, dict]]
+            The ``(key, text, payload)`` of every document, see ``add_document``
+
+        Returns
+        -------
+        TextIndex
+            The built index
+        """
+
+        index = cls()
+
+        for key, text, payload in documents:
+            index._remove(key)
+            index._insert(key, Counter(tokenize(text)), payload)
+
+        index._vocabulary = sorted(index._postings)
+
+        return index
+
+    def add_document(self, key: str, text: str, payload: dict):
+        """Add a document to the index, replacing the document with the same key
+
+        Parameters
+        ----------
+        key: str
+            The unique key of the document
+        text: str
+            The text to index
+        payload: dict
+            The data returned for the document in search results
+        """
+
+        terms = Counter(tokenize(text))
+
+        with self._lock:
+            self.remove_document(key)
+
+            for term in self._insert(key, terms, payload):
+                insort(self._vocabulary, term)
+
+    def _insert(self, key: str, terms: Counter, payload: dict) -> list[str]:
+        """Add a document that is not in the index, returning the terms that are new to the index"""
+
+        doc_number = self._next_doc_number
+        self._next_doc_number += 1
+
+        self._doc_numbers[key] = doc_number
+        self._doc_keys[doc_number] = key
+        self._doc_terms[doc_number] = terms
+        self._doc_payloads[doc_number] = payload
+        self._total_length += terms.total()
+
+        new_terms = []
+
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+
+            if postings is None:
+                postings = self._postings[term] = {}
+                new_terms.append(term)
+
+            postings[doc_number] = frequency
+
+        return new_terms
+
+    def remove_document(self, key: str):
+        """Remove a document from the index, if it exists
+
+        Parameters
+        ----------
+        key: str
+            The unique key of the document
+        """
+
+        with self._lock:
+            for term in self._remove(key):
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+
+    def _remove(self, key: str) -> list[str]:
+        """Remove a document, returning the terms that are no longer in the index"""
+
+        doc_number = self._doc_numbers.pop(key, None)
+
+        if doc_number is None:
+            return []
+
+        del self._doc_keys[doc_number]
+        del self._doc_payloads[doc_number]
+        terms = self._doc_terms.pop(doc_number)
+        self._total_length -= terms.total()
+
+        removed_terms = []
+
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_number]
+
+            if not postings:
+                del self._postings[term]
+                removed_terms.append(term)
+
+        return removed_terms
+
+    def _expand_prefix(self, prefix: str) -> list[str]:
+        start = bisect_left(self._vocabulary, prefix)
+        end = bisect_left(self._vocabulary, prefix + "\U0010ffff", lo=start)
+        terms = self._vocabulary[start:end]
+
+        if len(terms) > MAX_PREFIX_EXPANSIONS:
+            terms = heapq.nlargest(MAX_PREFIX_EXPANSIONS, terms, key=lambda t: len(self._postings[t]))
+
+        return terms
+
+    def search(self, query: str, limit: int) -> list[dict]:
+        """Search the index
+
+        Documents that match every query token are ranked by their BM25 score.
+        If no document matches every token, documents that match any of them are ranked instead.
+
+        Parameters
+        ----------
+        query: str
+            The search query, its last token is matched as a prefix
+        limit: int
+            The maximum number of results
+
+        Returns
+        -------
+        list[dict]
+            The payloads of the best matching documents, best match first
+        """
+
+        tokens = tokenize(query)
+
+        if not tokens:
+            return []
+
+        with self._lock:
+            if not self._doc_numbers:
+                return []
+
+            # Every query token becomes a group of alternative terms
+            term_groups = [[token] for token in tokens[:-1]]
+
+            if query[-1].isspace():
+                term_groups.append([tokens[-1]])
+            else:
+                term_groups.append(self._expand_prefix(tokens[-1]))
+
+            term_groups = [
+                [term for term in group if term in self._postings] for group in term_groups
+            ]
+
+            candidates = self._match_all(term_groups)
+
+            if not candidates:
+                candidates = set().union(*(self._postings[t] for group in term_groups for t in group))
+
+            scores = self._score(candidates, term_groups)
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+            return [self._doc_payloads[doc_number] for doc_number, _ in best]
+
+    def _match_all(self, term_groups: list[list[str]]) -> set[int]:
+        if any(not group for group in term_groups):
+            return set()
+
+        # Intersect starting with the rarest group to keep the candidate set small
+        group_postings = sorted(
+            (set().union(*(self._postings[term] for term in group)) for group in term_groups),
+            key=len
+        )
+
+        candidates = group_postings[0]
+
+        for postings in group_postings[1:]:
+            candidates = candidates & postings
+
+            if not candidates:
+                break
+
+        return candidates
+
+    def _score(self, candidates: set[int], term_groups: list[list[str]]) -> dict[int, float]:
+        doc_count = len(self._doc_numbers)
+        average_length = self._total_length / doc_count
+        scores = dict.fromkeys(candidates, 0.0)
+
+        for group in term_groups:
+            for term in group:
+                postings = self._postings[term]
+                document_frequency = len(postings)
+                idf = math.log(1 + (doc_count - document_frequency + 0.5) / (document_frequency + 0.5))
+
+                # Iterate over the smaller side of the candidates / postings pair
+                if len(postings) < len(scores):
+                    pairs = ((n, f) for n, f in postings.items() if n in scores)
+                else:
+                    pairs = ((n, postings[n]) for n in scores if n in postings)
+
+                for doc_number, frequency in pairs:
+                    length = self._doc_terms[doc_number].total()
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                    scores[doc_number] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        return scores
@@ -0,0 +1,112 @@
+from os import environ
+
+from bson import ObjectId
+
+from services.database import db_provider
+from utils.lru_cache import TTLCache
+
+# Book cache settings
+BOOK_CACHE_SIZE = int(environ.get("BOOK_CACHE_SIZE", 10000))
+BOOK_CACHE_TTL = int(environ.get("BOOK_CACHE_TTL", 3600))
+
+book_cache = TTLCache(max_size=BOOK_CACHE_SIZE, ttl=BOOK_CACHE_TTL)
+
+_BOOK_DETAILS_PROJECTION = {
+    "title": 1,
+    "authors": 1,
+    "description": 1,
+    "thumbnail": 1,
+    "identifiers": 1
+}
+
+
+def _to_book_details(book: dict) -> dict:
+    return {
+        "bookId": book["_id"],
+        "title": book.get("title"),
+        "authors": book.get("authors"),
+        "description": book.get("description"),
+        "thumbnail": book.get("thumbnail"),
+        "identifiers": book.get("identifiers", []),
+    }
+
+
+def _find_books(book_ids: list[ObjectId]) -> list[dict]:
+    # New books are added to the summaries by utils.book_changes, reads never write
+    return list(db_provider.col_book_summaries.find({"_id": {"$in": book_ids}}, projection=_BOOK_DETAILS_PROJECTION))
+
+
+def get_book_details(book_id: ObjectId) -> dict | None:
+    """Get the details of a book, reading through the book cache
+
+    Parameters
+    ----------
+    book_id: ObjectId
+        The id of the book
+
+    Returns
+    -------
+    dict | None
+        The book details as served by the API, or ``None`` if the book does not exist
+    """
+
+    details = book_cache.get(book_id)
+
+    if details is not None:
+        return details
+
+    books = _find_books([book_id])
+
+    if not books:
+        return None
+
+    details = _to_book_details(books[0])
+    book_cache.set(book_id, details)
+
+    return details
+
+
+def get_books_details(book_ids: list[ObjectId]) -> dict[ObjectId, dict]:
+    """Get the details of many books, fetching the uncached ones with a single query
+
+    Parameters
+    ----------
+    book_ids: list[ObjectId]
+        The ids of the books
+
+    Returns
+    -------
+    dict[ObjectId, dict]
+        The book details by book id, books that do not exist are left out
+    """
+
+    found = {}
+    missing_ids = []
+
+    for book_id in book_ids:
+        details = book_cache.get(book_id)
+
+        if details is None:
+            missing_ids.append(book_id)
+        else:
+            found[book_id] = details
+
+    if missing_ids:
+        for book in _find_books(missing_ids):
+            details = _to_book_details(book)
+            book_cache.set(book["_id"], details)
+            found[book["_id"]] = details
+
+    return found
+
+
+def invalidate_book(book_id: ObjectId):
+    """Remove a book from the book cache, to be called when the book changes
+
+    Parameters
+    ----------
+    book_id: ObjectId
+        The id of the changed book
+    """
+
+    book_cache.invalidate(book_id)
@@ -0,0 +1,260 @@
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from os import environ
+from threading import Event, Lock, Thread
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from services.database import db_provider
+from utils.book_cache import book_cache, invalidate_book
+from utils.book_summaries import reconcile_book_summaries, refresh_book_summary_view
+
+logger = logging.getLogger(__name__)
+
+# How often every book is refreshed if the database does not support change streams
+BOOK_CHANGES_REFRESH_INTERVAL = int(environ.get("BOOK_CHANGES_REFRESH_INTERVAL", 600))
+
+# The changes are applied by the one worker holding this lease, taken over by another one if not renewed in time
+BOOK_CHANGES_LEASE_SECONDS = int(environ.get("BOOK_CHANGES_LEASE_SECONDS", 60))
+
+# Changes that arrive together are applied at once, up to this many books
+BOOK_CHANGES_BATCH_SIZE = 500
+
+# Upper bound of the exponential backoff before a failed change stream is opened again
+BOOK_CHANGES_MAX_BACKOFF = 60
+
+_CHECKPOINT_ID = "bookChanges"
+
+# Raised by deployments that have no change streams, e.g. standalone servers
+_CHANGE_STREAMS_NOT_SUPPORTED = 40573
+
+_follower_pid: int | None = None
+_start_lock = Lock()
+_lease_owner = uuid.uuid4().hex
+
+
+def _reset_after_fork():
+    # The parent's threads don't exist in the child, which must not renew the parent's lease either
+    global _follower_pid, _start_lock, _lease_owner
+
+    _follower_pid = None
+    _start_lock = Lock()
+    _lease_owner = uuid.uuid4().hex
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def start_following_book_changes():
+    """Start following the changes of the books in the background, if not done already in this process
+
+    Every process removes the books whose summary changed from its own book cache, by following the
+    change stream of ``bookSummaries``. The summaries themselves are refreshed from ``rawBookDatas``
+    by a single process across all hosts, the one holding the ``bookChanges`` lease,
+    see ``apply_book_changes``.
+    """
+
+    global _follower_pid
+
+    if _follower_pid == os.getpid():
+        return
+
+    with _start_lock:
+        if _follower_pid != os.getpid():
+            _follower_pid = os.getpid()
+            Thread(target=_apply_changes_when_leader, name="book-changes", daemon=True).start()
+            Thread(target=_invalidate_changed_books, name="book-cache-invalidation", daemon=True).start()
+
+
+def apply_book_changes(book_ids: list[ObjectId]):
+    """Bring the summaries of the books up to date after they changed
+
+    The ``bookSummaries`` collection is refreshed first, then the summaries stored in
+    the libraries and tracking statuses are reconciled with it. The book caches of
+    the workers follow the changes of ``bookSummaries`` themselves.
+
+    Parameters
+    ----------
+    book_ids: list[ObjectId]
+        The ids of the books that were inserted, updated or deleted
+    """
+
+    refresh_book_summary_view(book_ids=book_ids)
+    reconcile_book_summaries(book_ids=book_ids)
+
+
+def _refresh_every_book():
+    refresh_book_summary_view()
+    reconcile_book_summaries()
+
+
+def _backoff_delay(failures: int) -> float:
+    # Jittered, so the workers of a host don't reconnect all at once
+    return random.uniform(0.5, 1) * min(2 ** failures, BOOK_CHANGES_MAX_BACKOFF)
+
+
+def _claim_lease() -> bool:
+    now = datetime.now(tz=timezone.utc)
+
+    try:
+        # Also renews the lease if this process holds it already
+        db_provider.col_job_checkpoints.find_one_and_update(
+            {
+                "_id": _CHECKPOINT_ID,
+                "$or": [
+                    {"leaseOwner": _lease_owner},
+                    {"leaseExpiresAt": {"$lt": now}},
+                    {"leaseExpiresAt": {"$exists": False}}
+                ]
+            },
+            {"$set": {"leaseOwner": _lease_owner, "leaseExpiresAt": now + timedelta(seconds=BOOK_CHANGES_LEASE_SECONDS)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Held by another process whose lease is still valid
+        return False
+
+    return True
+
+
+def _save_resume_token(resume_token: dict):
+    db_provider.col_job_checkpoints.update_one(
+        {"_id": _CHECKPOINT_ID, "leaseOwner": _lease_owner},
+        {"$set": {"resumeToken": resume_token}}
+    )
+
+
+def _renew_lease(stop: Event, lease_lost: Event):
+    while not stop.wait(BOOK_CHANGES_LEASE_SECONDS / 3):
+        try:
+            if not _claim_lease():
+                lease_lost.set()
+                return
+        except PyMongoError:
+            logger.exception("Renewing the book changes lease failed")
+
+
+def _apply_changes_when_leader():
+    failures = 0
+
+    while True:
+        try:
+            if not _claim_lease():
+                time.sleep(BOOK_CHANGES_LEASE_SECONDS / 3)
+                continue
+
+            stop_renewing = Event()
+            lease_lost = Event()
+            renewer = Thread(
+                target=_renew_lease,
+                args=(stop_renewing, lease_lost),
+                name="book-changes-lease",
+                daemon=True
+            )
+            renewer.start()
+
+            try:
+                _apply_changes_while_leader(lease_lost)
+            finally:
+                stop_renewing.set()
+                renewer.join()
+
+            failures = 0
+        except PyMongoError:
+            failures += 1
+            logger.exception("Applying book changes failed, retrying")
+            time.sleep(_backoff_delay(failures))
+
+
+def _apply_changes_while_leader(lease_lost: Event):
+    # Returns when the lease is lost, and raises if the changes can't be applied, to be retried with backoff
+    checkpoint = db_provider.col_job_checkpoints.find_one({"_id": _CHECKPOINT_ID}, projection={"resumeToken": 1})
+    resume_token = (checkpoint or {}).get("resumeToken")
+
+    try:
+        stream = db_provider.col_raw_book_datas.watch(max_await_time_ms=1000, resume_after=resume_token)
+    except OperationFailure as e:
+        if e.code == _CHANGE_STREAMS_NOT_SUPPORTED:
+            logger.info("Change streams are not supported, refreshing every book periodically")
+
+            # Also picks up the books that were changed or deleted, not only the new ones
+            while True:
+                _refresh_every_book()
+
+                if lease_lost.wait(BOOK_CHANGES_REFRESH_INTERVAL):
+                    return
+
+        if resume_token is None:
+            raise
+
+        # The stored position is no longer in the oplog, so every book is refreshed below
+        logger.warning("Book changes can't be resumed from the stored position, refreshing every book")
+        stream = db_provider.col_raw_book_datas.watch(max_await_time_ms=1000)
+        resume_token = None
+
+    with stream:
+        # The stream is opened first, so the changes made while every book is refreshed are applied after it
+        if resume_token is None:
+            _refresh_every_book()
+            _save_resume_token(stream.resume_token)
+
+        save_at = time.monotonic() + BOOK_CHANGES_LEASE_SECONDS / 3
+
+        while stream.alive and not lease_lost.is_set():
+            book_ids = set()
+
+            # Drain what has arrived, so that an import is applied in batches
+            while len(book_ids) < BOOK_CHANGES_BATCH_SIZE:
+                change = stream.try_next()
+
+                if change is None:
+                    break
+
+                if "documentKey" in change:
+                    book_ids.add(change["documentKey"]["_id"])
+
+            if book_ids:
+                # A failed batch raises before its position is saved, so it's applied again after reopening the stream
+                apply_book_changes(list(book_ids))
+            elif time.monotonic() < save_at:
+                continue
+
+            # Saved while idle too, so the position doesn't fall out of the oplog
+            _save_resume_token(stream.resume_token)
+            save_at = time.monotonic() + BOOK_CHANGES_LEASE_SECONDS / 3
+
+
+def _invalidate_changed_books():
+    resume_token = None
+    failures = 0
+
+    while True:
+        try:
+            with db_provider.col_book_summaries.watch(max_await_time_ms=1000, resume_after=resume_token) as stream:
+                while stream.alive:
+                    change = stream.try_next()
+
+                    if change is not None and "documentKey" in change:
+                        invalidate_book(change["documentKey"]["_id"])
+
+                    resume_token = stream.resume_token
+                    failures = 0
+        except OperationFailure as e:
+            if e.code == _CHANGE_STREAMS_NOT_SUPPORTED:
+                logger.info("Change streams are not supported, cached books expire after BOOK_CACHE_TTL instead")
+                return
+
+            # The changes since the stored position may be lost, so none of the cached books can be trusted
+            logger.warning("Book summary changes can't be resumed, clearing the book cache")
+            resume_token = None
+            book_cache.clear()
+        except PyMongoError:
+            logger.exception("Following book summary changes failed, resuming")
+
+        failures += 1
+        time.sleep(_backoff_delay(failures))
@@ -0,0 +1,189 @@
+import random
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ASCENDING
+
+from services.database import db_provider
+from services.recommendation import eligible_book_pools
+from utils.concurrency import run_concurrently
+from utils.owned_books import to_raw_ids
+
+# Books lost to duplicates between the categories, or to books that are no longer eligible,
+# are replaced by drawing again at most this many times
+SAMPLE_MAX_REDRAWS = 3
+
+_RECOMMENDATION_PROJECTION = {
+    "title": 1,
+    "authors": 1,
+    "description": 1,
+    "thumbnail": 1
+}
+
+
+def _to_recommendation(book: dict) -> dict:
+    return {
+        "bookId": book["_id"],
+        "title": book.get("title"),
+        "authors": book.get("authors"),
+        "description": book.get("description"),
+        "thumbnail": book.get("thumbnail")
+    }
+
+
+def fetch_recommendations(book_ids: list[ObjectId]) -> list[dict]:
+    """Fetch the books to recommend with a single query
+
+    Books that can't be recommended are left out.
+
+    Parameters
+    ----------
+    book_ids: list[ObjectId]
+        The ids of the books
+
+    Returns
+    -------
+    list[dict]
+        The books with ``bookId``, ``title``, ``authors``, ``description`` and ``thumbnail`` fields
+    """
+
+    if not book_ids:
+        return []
+
+    books = db_provider.col_book_summaries.find(
+        {"_id": {"$in": book_ids}, "eligible": True},
+        projection=_RECOMMENDATION_PROJECTION
+    )
+
+    return list(map(_to_recommendation, books))
+
+
+def _sample_with_random_key(size: int, category: str | None, excluded_ids: list[ObjectId]) -> list[dict]:
+    if size <= 0:
+        return []
+
+    query: dict = {"eligible": True}
+
+    if category is not None:
+        query["category"] = category
+
+    # Excluded books are skipped by the range read itself, so they leave no gaps
+    if excluded_ids:
+        query["_id"] = {"$nin": excluded_ids}
+
+    start = random.random()
+
+    books = list(db_provider.col_book_summaries.find(
+        {**query, "randKey": {"$gte": start}},
+        projection=_RECOMMENDATION_PROJECTION
+    ).sort("randKey", ASCENDING).limit(size))
+
+    if len(books) < size:
+        books += db_provider.col_book_summaries.find(
+            {**query, "randKey": {"$lt": start}},
+            projection=_RECOMMENDATION_PROJECTION
+        ).sort("randKey", ASCENDING).limit(size - len(books))
+
+    return list(map(_to_recommendation, books))
+
+
+def sample_eligible_books_by_category(
+        category_counts: dict[str | None, int],
+        exclude: np.ndarray | None = None
+) -> list[dict]:
+    """Pick random books that can be recommended, from several categories at once
+
+    Once the in-memory ``eligible_book_pools`` are built, the ids are drawn in-process
+    and the books are fetched with a single ``$in`` query.
+
+    Until then, the books of every category are read from ``bookSummaries`` in ``randKey`` order from a random
+    starting point, wrapping around to the start of the key space if needed. This is a short
+    range read on the ``(category, eligible, randKey)`` or ``(eligible, randKey)`` index,
+    so it costs the same no matter how large the catalog is.
+
+    A book can be picked both from its category and from every category. Such duplicates are replaced
+    by drawing only the missing books again, without the picked ones, until the counts add up or the books run out.
+
+    Parameters
+    ----------
+    category_counts: dict[str | None, int]
+        How many books to pick from each category, ``None`` picks from every category
+    exclude: np.ndarray | None
+        Sorted raw ids of the books not to pick, see ``utils.owned_books``
+
+    Returns
+    -------
+    list[dict]
+        The picked books with ``bookId``, ``title``, ``authors``, ``description`` and ``thumbnail`` fields,
+        without duplicates and in random order
+    """
+
+    categories = [category for category, count in category_counts.items() if count > 0]
+    size = sum(category_counts[category] for category in categories)
+    books = _sample_once(category_counts, exclude)
+
+    # A single category is topped up from itself, several ones from every category
+    redraw_category = categories[0] if len(categories) == 1 else None
+
+    for _ in range(SAMPLE_MAX_REDRAWS):
+        if len(books) >= size:
+            break
+
+        picked_ids = to_raw_ids(book["bookId"] for book in books)
+        redraw_exclude = picked_ids if exclude is None else np.union1d(exclude, picked_ids)
+        extra_books = _sample_once({redraw_category: size - len(books)}, redraw_exclude)
+
+        # Every book that could be picked is picked already
+        if not extra_books:
+            break
+
+        books += extra_books
+
+    random.shuffle(books)
+
+    return books
+
+
+def _sample_once(category_counts: dict[str | None, int], exclude: np.ndarray | None) -> list[dict]:
+    eligible_book_pools.start()
+
+    if eligible_book_pools.is_ready:
+        book_ids = eligible_book_pools.draw(category_counts, np.random.default_rng(), exclude=exclude)
+        books = fetch_recommendations(book_ids)
+    else:
+        excluded_ids = [] if exclude is None else [ObjectId(bytes(raw_id)) for raw_id in exclude]
+
+        calls = [
+            (lambda c=category, n=count: _sample_with_random_key(n, c, excluded_ids))
+            for category, count in category_counts.items()
+            if count > 0
+        ]
+        samples = run_concurrently(*calls) if calls else []
+
+        # A book can be picked both from its category and from every category
+        books = list({book["bookId"]: book for sample in samples for book in sample}.values())
+
+    return books
+
+
+def sample_eligible_books(size: int, category: str | None = None, exclude: np.ndarray | None = None) -> list[dict]:
+    """Pick random books that can be recommended
+
+    See ``sample_eligible_books_by_category`` for how the books are picked.
+
+    Parameters
+    ----------
+    size: int
+        The number of books to pick
+    category: str | None
+        The category to pick from, or ``None`` to pick from every category
+    exclude: np.ndarray | None
+        Sorted raw ids of the books not to pick, see ``utils.owned_books``
+
+    Returns
+    -------
+    list[dict]
+        The picked books with ``bookId``, ``title``, ``authors``, ``description`` and ``thumbnail`` fields
+    """
+
+    return sample_eligible_books_by_category({category: size}, exclude=exclude)
@@ -0,0 +1,208 @@
+from datetime import datetime, timezone
+from os import environ
+from typing import Callable
+
+from bson import ObjectId
+from pymongo import UpdateMany
+
+from services.database import db_provider
+
+# Reconciler settings
+BOOK_SUMMARY_RECONCILE_CHUNK_SIZE = int(environ.get("BOOK_SUMMARY_RECONCILE_CHUNK_SIZE", 500))
+
+# The fields of the books that the API serves, and the flags that decide which books can be recommended.
+# Books that can be recommended are not for mature audiences and have a description.
+BOOK_SUMMARY_VIEW_STAGES = [
+    {
+        "$project": {
+            "title": "$volumeInfo.title",
+            "authors": "$volumeInfo.authors",
+            "description": "$volumeInfo.description",
+            "thumbnail": "$volumeInfo.imageLinks.thumbnail",
+            "identifiers": "$volumeInfo.industryIdentifiers",
+            "category": 1,
+            "maturityRating": "$volumeInfo.maturityRating",
+            "hasDescription": {"$gt": [{"$strLenCP": {"$ifNull": ["$volumeInfo.description", ""]}}, 0]},
+            "randKey": {"$ifNull": ["$randKey", {"$rand": {}}]}
+        }
+    }, {
+        "$set": {
+            "eligible": {"$and": [{"$ne": ["$maturityRating", "MATURE"]}, "$hasDescription"]}
+        }
+    }
+]
+
+_BOOK_SUMMARY_PROJECTION = {
+    "title": 1,
+    "authors": 1,
+    "thumbnail": 1,
+    "category": 1
+}
+
+
+def refresh_book_summary_view(book_ids: list[ObjectId] | None = None, only_new: bool = False):
+    """Refresh the ``bookSummaries`` collection from ``rawBookDatas``
+
+    The summaries are built and written by a single ``$merge`` pipeline, so the books never leave the server.
+    Summaries of the refreshed books that no longer exist are removed, unless only new books are added.
+
+    Parameters
+    ----------
+    book_ids: list[ObjectId] | None
+        The ids of the books that changed or were deleted, or ``None`` to refresh every book
+    only_new: bool
+        Whether to only add the books that have no summary yet, like newly imported ones
+    """
+
+    refreshed_at = datetime.now(tz=timezone.utc)
+    pipeline = []
+
+    if book_ids is not None:
+        pipeline.append({"$match": {"_id": {"$in": book_ids}}})
+
+    pipeline += BOOK_SUMMARY_VIEW_STAGES
+    pipeline += [
+        {"$set": {"refreshedAt": {"$literal": refreshed_at}}},
+        {
+            "$merge": {
+                "into": db_provider.col_book_summaries.name,
+                "on": "_id",
+                "whenMatched": "keepExisting" if only_new else "replace",
+                "whenNotMatched": "insert"
+            }
+        }
+    ]
+
+    db_provider.col_raw_book_datas.aggregate(pipeline, allowDiskUse=True)
+
+    if not only_new:
+        stale_query = {"refreshedAt": {"$lt": refreshed_at}}
+
+        if book_ids is not None:
+            stale_query["_id"] = {"$in": book_ids}
+
+        db_provider.col_book_summaries.delete_many(stale_query)
+
+
+def to_book_summary(book: dict) -> dict:
+    """Build the summary of a book that is stored in the libraries and tracking statuses
+
+    The fields are always in the same order, so stored summaries can be compared as a whole.
+
+    Parameters
+    ----------
+    book: dict
+        The book from the ``bookSummaries`` collection, with at least the fields of ``_BOOK_SUMMARY_PROJECTION``
+
+    Returns
+    -------
+    dict
+        The summary with ``title``, ``authors``, ``thumbnail`` and ``category`` fields
+    """
+
+    return {
+        "title": book.get("title"),
+        "authors": book.get("authors"),
+        "thumbnail": book.get("thumbnail"),
+        "category": book.get("category")
+    }
+
+
+def get_book_summary(book_id: ObjectId) -> dict | None:
+    """Get the summary of a book
+
+    Parameters
+    ----------
+    book_id: ObjectId
+        The id of the book
+
+    Returns
+    -------
+    dict | None
+        The summary, or ``None`` if the book does not exist
+    """
+
+    book = db_provider.col_book_summaries.find_one({"_id": book_id}, projection=_BOOK_SUMMARY_PROJECTION)
+
+    if book is None:
+        return None
+
+    return to_book_summary(book)
+
+
+def _build_reconcile_operations(book: dict) -> tuple[UpdateMany, UpdateMany]:
+    summary = to_book_summary(book)
+    summary_field = f"bookSummaries.{book['_id']}"
+
+    # Documents that already have the current summary are not rewritten
+    return (
+        UpdateMany(
+            {"books": book["_id"], summary_field: {"$ne": summary}},
+            {"$set": {summary_field: summary}}
+        ),
+        UpdateMany(
+            {"bookId": book["_id"], "bookSummary": {"$ne": summary}},
+            {"$set": {"bookSummary": summary}}
+        )
+    )
+
+
+def reconcile_book_summaries(
+        book_ids: list[ObjectId] | None = None,
+        on_progress: Callable[[int], None] | None = None
+) -> int:
+    """Refresh the book summaries stored in the libraries and tracking statuses
+
+    The summaries are read from the ``bookSummaries`` collection, so refresh it first.
+    The books are read in chunks of ``BOOK_SUMMARY_RECONCILE_CHUNK_SIZE``, and the summaries of every chunk
+    are written with one unordered ``bulk_write`` per collection. Only documents whose summary differs
+    from the book are updated, so running it when nothing changed costs no writes.
+
+    Parameters
+    ----------
+    book_ids: list[ObjectId] | None
+        The ids of the books that changed, or ``None`` to reconcile every book
+    on_progress: Callable[[int], None] | None
+        Called with the number of processed books after every chunk
+
+    Returns
+    -------
+    int
+        The number of updated libraries and tracking statuses
+    """
+
+    query = {} if book_ids is None else {"_id": {"$in": book_ids}}
+    books = db_provider.col_book_summaries.find(query, projection=_BOOK_SUMMARY_PROJECTION)
+
+    processed = 0
+    modified = 0
+    library_operations = []
+    tracking_operations = []
+
+    def write_chunk():
+        nonlocal modified
+
+        if library_operations:
+            modified += db_provider.col_book_libraries.bulk_write(library_operations, ordered=False).modified_count
+
+        if tracking_operations:
+            modified += db_provider.col_book_tracking_statuses.bulk_write(tracking_operations, ordered=False).modified_count
+
+        library_operations.clear()
+        tracking_operations.clear()
+
+        if on_progress is not None:
+            on_progress(processed)
+
+    for book in books:
+        library_operation, tracking_operation = _build_reconcile_operations(book)
+        library_operations.append(library_operation)
+        tracking_operations.append(tracking_operation)
+        processed += 1
+
+        if len(library_operations) >= BOOK_SUMMARY_RECONCILE_CHUNK_SIZE:
+            write_chunk()
+
+    write_chunk()
+
+    return modified
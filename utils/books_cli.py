@@ -0,0 +1,63 @@
+import click
+from flask.cli import AppGroup
+
+books_cli = AppGroup("books", help="Book catalog maintenance commands.")
+
+
+@books_cli.command("refresh-summary-view")
+@click.option("--new-only", is_flag=True, help="Only add the books that have no summary yet.")
+def refresh_summary_view_command(new_only: bool):
+    """Refresh the bookSummaries collection that books are served and recommended from."""
+
+    from services.database import db_provider
+    from utils.book_summaries import refresh_book_summary_view
+
+    refresh_book_summary_view(only_new=new_only)
+
+    click.echo(f"Book summaries: {db_provider.col_book_summaries.estimated_document_count()}")
+
+
+@books_cli.command("build-similar")
+@click.option("--new-only", is_flag=True, help="Only build the similar books of books that have none yet.")
+def build_similar_books_command(new_only: bool):
+    """Build the table of similar books served by /books/<id>/similar."""
+
+    from utils.similar_books import build_similar_books
+
+    built = build_similar_books(
+        only_new=new_only,
+        on_progress=lambda count: click.echo(f"Processed books: {count}")
+    )
+
+    click.echo(f"Built similar books: {built}")
+
+
+@books_cli.command("build-co-liked")
+@click.option(
+    "--normalization",
+    type=click.Choice(["cosine", "jaccard"]),
+    default="cosine",
+    help="How the number of users who liked both books is normalized."
+)
+def build_co_liked_books_command(normalization: str):
+    """Build the table of books liked by the same users, blended into /recommendations."""
+
+    from utils.co_liked_books import build_co_liked_books
+
+    built = build_co_liked_books(
+        normalization=normalization,
+        on_progress=lambda count: click.echo(f"Processed libraries: {count}")
+    )
+
+    click.echo(f"Books with co-liked books: {built}")
+
+
+@books_cli.command("reconcile-summaries")
+def reconcile_summaries_command():
+    """Refresh the book summaries stored in libraries and tracking statuses after books changed."""
+
+    from utils.book_summaries import reconcile_book_summaries
+
+    modified = reconcile_book_summaries(on_progress=lambda count: click.echo(f"Processed books: {count}"))
+
+    click.echo(f"Updated documents: {modified}")
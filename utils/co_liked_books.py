@@ -0,0 +1,256 @@
+import heapq
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from os import environ
+from typing import Callable
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne
+from scipy import sparse
+
+from services.database import db_provider
+
+# Item-item collaborative filtering settings
+CO_LIKED_BOOKS_COUNT = int(environ.get("CO_LIKED_BOOKS_COUNT", 50))
+CO_LIKED_BOOKS_MIN_CO_LIKES = int(environ.get("CO_LIKED_BOOKS_MIN_CO_LIKES", 2))
+CO_LIKED_BOOKS_WORKERS = int(environ.get("CO_LIKED_BOOKS_WORKERS", os.cpu_count() or 1))
+CO_LIKED_BOOKS_CHUNK_SIZE = int(environ.get("CO_LIKED_BOOKS_CHUNK_SIZE", 10000))
+
+# Only the most recent likes of a user are used to pick the books to recommend
+CO_LIKED_BOOKS_RECENT_LIKES = 20
+
+_WRITE_BATCH_SIZE = 1000
+
+NORMALIZATIONS = ("cosine", "jaccard")
+
+
+def _count_co_likes(indptr: np.ndarray, indices: np.ndarray, book_count: int) -> sparse.csr_matrix:
+    """Count how many users of a chunk liked every pair of books, runs in a worker process"""
+
+    likes = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.int32), indices, indptr),
+        shape=(len(indptr) - 1, book_count)
+    )
+
+    return (likes.T @ likes).tocsr()
+
+
+def _add_counts(total: sparse.csr_matrix | None, counts: sparse.csr_matrix) -> sparse.csr_matrix:
+    if total is None:
+        return counts
+
+    # Chunks submitted earlier know fewer books
+    size = max(total.shape[0], counts.shape[0])
+    total.resize((size, size))
+    counts.resize((size, size))
+
+    return total + counts
+
+
+def _build_co_like_counts(on_progress: Callable[[int], None] | None) -> tuple[list[ObjectId], sparse.csr_matrix | None]:
+    book_ids: list[ObjectId] = []
+    columns: dict[ObjectId, int] = {}
+
+    total = None
+    pending: set[Future] = set()
+    processed = 0
+
+    chunk_indptr = [0]
+    chunk_indices: list[int] = []
+
+    # Workers are spawned instead of forked, so they don't inherit the server's threads and sockets
+    with ProcessPoolExecutor(
+        max_workers=CO_LIKED_BOOKS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        def submit_chunk():
+            nonlocal total, chunk_indptr, chunk_indices, processed
+
+            # Keep a bounded number of chunks in flight, so the parent doesn't outrun the workers
+            while len(pending) >= CO_LIKED_BOOKS_WORKERS * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    pending.remove(future)
+                    total = _add_counts(total, future.result())
+
+            pending.add(executor.submit(
+                _count_co_likes,
+                np.array(chunk_indptr, dtype=np.int64),
+                np.array(chunk_indices, dtype=np.int64),
+                len(book_ids)
+            ))
+
+            processed += len(chunk_indptr) - 1
+            chunk_indptr, chunk_indices = [0], []
+
+            if on_progress is not None:
+                on_progress(processed)
+
+        libraries = db_provider.col_book_libraries.find({"title": "_likedBooks"}, projection={"books": 1})
+
+        for library in libraries:
+            liked_books = set(library.get("books", []))
+
+            # A single like co-occurs with nothing
+            if len(liked_books) < 2:
+                continue
+
+            for book_id in liked_books:
+                column = columns.get(book_id)
+
+                if column is None:
+                    column = columns[book_id] = len(book_ids)
+                    book_ids.append(book_id)
+
+                chunk_indices.append(column)
+
+            chunk_indptr.append(len(chunk_indices))
+
+            if len(chunk_indptr) - 1 >= CO_LIKED_BOOKS_CHUNK_SIZE:
+                submit_chunk()
+
+        if len(chunk_indptr) > 1:
+            submit_chunk()
+
+        for future in pending:
+            total = _add_counts(total, future.result())
+
+    if total is not None:
+        total.resize((len(book_ids), len(book_ids)))
+
+    return book_ids, total
+
+
+def _normalize(counts: sparse.csr_matrix, normalization: str) -> sparse.csr_matrix:
+    # The diagonal holds the number of likes of every book
+    like_counts = counts.diagonal().astype(np.float32)
+
+    counts = counts.tocoo()
+    keep = (counts.row != counts.col) & (counts.data >= CO_LIKED_BOOKS_MIN_CO_LIKES)
+    rows, cols, co_likes = counts.row[keep], counts.col[keep], counts.data[keep].astype(np.float32)
+
+    if normalization == "jaccard":
+        scores = co_likes / (like_counts[rows] + like_counts[cols] - co_likes)
+    else:
+        scores = co_likes / np.sqrt(like_counts[rows] * like_counts[cols])
+
+    return sparse.csr_matrix((scores, (rows, cols)), shape=counts.shape)
+
+
+def build_co_liked_books(
+        normalization: str = "cosine",
+        on_progress: Callable[[int], None] | None = None
+) -> int:
+    """Build the table of books that are liked by the same users, served by ``get_co_liked_book_ids``
+
+    Every user's ``_likedBooks`` library is streamed once. The libraries are split into chunks
+    of ``CO_LIKED_BOOKS_CHUNK_SIZE`` users, and the book-book co-occurrence counts of every chunk
+    are computed as a sparse matrix product in ``CO_LIKED_BOOKS_WORKERS`` worker processes.
+    The summed counts are normalized, and the ``CO_LIKED_BOOKS_COUNT`` best neighbours of every
+    book are stored. Books that no longer have neighbours are removed from the table.
+
+    Parameters
+    ----------
+    normalization: str
+        ``"cosine"`` or ``"jaccard"``
+    on_progress: Callable[[int], None] | None
+        Called with the number of streamed libraries after every chunk
+
+    Returns
+    -------
+    int
+        The number of books that have neighbours
+    """
+
+    if normalization not in NORMALIZATIONS:
+        raise ValueError(f"Unknown normalization '{normalization}'")
+
+    built_at = datetime.now(tz=timezone.utc)
+    book_ids, counts = _build_co_like_counts(on_progress)
+    stored = 0
+
+    if counts is not None:
+        scores = _normalize(counts, normalization)
+        operations = []
+
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+
+            if start == end:
+                continue
+
+            row_scores = scores.data[start:end]
+            row_columns = scores.indices[start:end]
+
+            if len(row_scores) > CO_LIKED_BOOKS_COUNT:
+                kept = np.argpartition(-row_scores, CO_LIKED_BOOKS_COUNT - 1)[:CO_LIKED_BOOKS_COUNT]
+                row_scores, row_columns = row_scores[kept], row_columns[kept]
+
+            order = np.argsort(-row_scores)
+
+            operations.append(ReplaceOne(
+                {"_id": book_ids[row]},
+                {
+                    "neighbours": [
+                        {"bookId": book_ids[column], "score": round(score, 4)}
+                        for column, score in zip(row_columns[order].tolist(), row_scores[order].tolist())
+                    ],
+                    "builtAt": built_at
+                },
+                upsert=True
+            ))
+
+            if len(operations) >= _WRITE_BATCH_SIZE:
+                db_provider.col_co_liked_books.bulk_write(operations, ordered=False)
+                stored += len(operations)
+                operations = []
+
+        if operations:
+            db_provider.col_co_liked_books.bulk_write(operations, ordered=False)
+            stored += len(operations)
+
+    db_provider.col_co_liked_books.delete_many({"builtAt": {"$lt": built_at}})
+
+    return stored
+
+
+def get_co_liked_book_ids(user_id: ObjectId, size: int, exclude: set[ObjectId] | None = None) -> list[ObjectId]:
+    """Pick the books most liked together with the user's recent likes
+
+    Parameters
+    ----------
+    user_id: ObjectId
+        The id of the user
+    size: int
+        The maximum number of books to pick
+    exclude: set[ObjectId] | None
+        The ids of the books not to pick
+
+    Returns
+    -------
+    list[ObjectId]
+        The ids of the picked books, best first, without the recently liked and the excluded books
+    """
+
+    library = db_provider.col_book_libraries.find_one(
+        {"authorId": user_id, "title": "_likedBooks"},
+        projection={"books": {"$slice": -CO_LIKED_BOOKS_RECENT_LIKES}}
+    )
+
+    if library is None or not library.get("books"):
+        return []
+
+    liked_books = set(library["books"])
+    excluded = liked_books | (exclude or set())
+    scores: dict[ObjectId, float] = {}
+
+    for doc in db_provider.col_co_liked_books.find({"_id": {"$in": list(liked_books)}}):
+        for neighbour in doc["neighbours"]:
+            if neighbour["bookId"] not in excluded:
+                scores[neighbour["bookId"]] = scores.get(neighbour["bookId"], 0) + neighbour["score"]
+
+    return heapq.nlargest(size, scores, key=scores.__getitem__)
@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+from functools import wraps
+from os import environ
+
+from flask import Flask, Response, g, request
+
+from utils.lru_cache import TTLCache
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Response compression settings
+COMPRESSION_MIN_SIZE = int(environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_ZSTD_LEVEL = int(environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+
+# Precompressed body cache settings
+COMPRESSION_CACHE_SIZE = int(environ.get("COMPRESSION_CACHE_SIZE", 1000))
+COMPRESSION_CACHE_TTL = int(environ.get("COMPRESSION_CACHE_TTL", 3600))
+
+_COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/html", "text/plain"}
+
+compressed_body_cache = TTLCache(max_size=COMPRESSION_CACHE_SIZE, ttl=COMPRESSION_CACHE_TTL)
+
+
+def _supported_encodings() -> list[str]:
+    # In order of preference, when the client accepts several of them equally
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(data)
+
+    # A fixed modification time keeps the output the same for the same body
+    return gzip.compress(data, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def precompressed(f):
+    """Decorator that serves the compressed body of the route from ``compressed_body_cache``
+
+    Use it on routes whose bodies repeat, like the details of a book. Bodies are cached by
+    their digest, so a changed body is compressed again and a stale one is never served.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        g.precompressed = True
+
+        return f(*args, **kwargs)
+
+    return decorated_function
+
+
+def compress_response(response: Response) -> Response:
+    """Compress the body of the response with the best encoding the client accepts
+
+    Only non-streamed text responses of at least ``COMPRESSION_MIN_SIZE`` bytes with a body and
+    a ``2xx`` or ``3xx`` status are compressed, error responses are sent as they are.
+    gzip is always supported, zstd too if the ``zstandard`` package is installed.
+
+    Parameters
+    ----------
+    response: Response
+        The response to compress
+
+    Returns
+    -------
+    Response
+        The same response, compressed in place if needed
+    """
+
+    if (
+            response.mimetype not in _COMPRESSIBLE_MIMETYPES
+            or not 200 <= response.status_code < 400 or response.status_code in (204, 304)
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    # Caches must not serve a compressed body to clients that did not ask for it
+    response.vary.add("Accept-Encoding")
+
+    encoding = request.accept_encodings.best_match(_supported_encodings())
+
+    if encoding is None or (response.content_length or 0) < COMPRESSION_MIN_SIZE:
+        return response
+
+    data = response.get_data()
+
+    if g.get("precompressed"):
+        cache_key = (encoding, hashlib.blake2b(data, digest_size=16).digest())
+        compressed = compressed_body_cache.get(cache_key)
+
+        if compressed is None:
+            compressed = _compress(data, encoding)
+            compressed_body_cache.set(cache_key, compressed)
+    else:
+        compressed = _compress(data, encoding)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+
+    return response
+
+
+def init_compression(app: Flask):
+    """Compress the responses of the application, see ``compress_response``
+
+    Parameters
+    ----------
+    app: Flask
+        The application
+    """
+
+    app.after_request(compress_response)
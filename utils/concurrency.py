@@ -0,0 +1,68 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from os import environ
+from typing import Any, Callable
+
+from flask import copy_current_request_context, has_request_context
+
+# Number of threads that run the independent queries of requests concurrently
+DB_QUERY_THREADS = int(environ.get("DB_QUERY_THREADS", 16))
+
+_executor = ThreadPoolExecutor(max_workers=DB_QUERY_THREADS, thread_name_prefix="db-query")
+
+
+def _reset_after_fork():
+    # The parent's threads don't exist in a forked child
+    global _executor
+
+    _executor = ThreadPoolExecutor(max_workers=DB_QUERY_THREADS, thread_name_prefix="db-query")
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_concurrently(*calls: Callable[[], Any]) -> list[Any]:
+    """Run independent calls, usually database queries, concurrently
+
+    The first call runs on the calling thread, the others on a shared thread pool.
+    PyMongo releases the GIL while waiting for the server, so the total latency is
+    that of the slowest call instead of the sum of all of them.
+    If called while handling a request, the request context is available to every call.
+
+    Here is an example of how you can use this function:
+
+    ```python
+    library_books, tracked_books = run_concurrently(
+        lambda: list(db_provider.col_book_libraries.find({"authorId": user_id}, projection={"books": 1})),
+        lambda: list(db_provider.col_book_tracking_statuses.find({"ownerUserId": user_id}, projection={"bookId": 1}))
+    )
+    ```
+
+    Parameters
+    ----------
+    calls: Callable[[], Any]
+        The calls to run, they must not depend on each other
+
+    Returns
+    -------
+    list[Any]
+        The results of the calls, in the same order as the calls
+
+    Raises
+    ------
+    Exception
+        The first exception raised by any of the calls, after every call has finished
+    """
+
+    if has_request_context():
+        calls = tuple(copy_current_request_context(call) for call in calls)
+
+    futures = [_executor.submit(call) for call in calls[1:]]
+
+    try:
+        first_result = calls[0]()
+    finally:
+        # Wait for every call, so none of them outlives the request
+        wait(futures)
+
+    return [first_result, *(future.result() for future in futures)]
@@ -0,0 +1,89 @@
+from datetime import date, datetime
+from decimal import Decimal
+from os import environ
+from typing import Any
+
+import orjson
+from bson import Decimal128, ObjectId
+from flask import Flask, Response
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+# "orjson" serializes responses with orjson, "stdlib" with the json module of the standard library
+JSON_BACKEND = environ.get("JSON_BACKEND", "orjson")
+
+# Non-string keys are allowed like with the json module, e.g. counters keyed by number
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    """Convert the values that neither serializer handles natively"""
+
+    if isinstance(obj, ObjectId):
+        return str(obj)
+
+    if isinstance(obj, (Decimal, Decimal128)):
+        return str(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonJSONProvider(JSONProvider):
+    """Serializes responses with orjson.
+
+    ``ObjectId`` values are written as their hex string, and dates as ISO 8601 strings.
+    Routes can therefore return database documents as they are, without converting them first.
+    Keys are written in the order of the documents, not sorted.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        option = _ORJSON_OPTIONS
+
+        if self._app.debug:
+            option |= orjson.OPT_INDENT_2
+
+        # The serialized bytes are sent as they are, without decoding them to a string first
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=option),
+            mimetype="application/json"
+        )
+
+
+class BsonJSONProvider(DefaultJSONProvider):
+    """Serializes responses with the json module, writing values the same way as ``OrjsonJSONProvider``"""
+
+    @staticmethod
+    def default(obj: Any) -> Any:
+        # Dates are written as ISO 8601 strings instead of Flask's HTTP date format
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+
+        return _default(obj)
+
+
+def init_json_provider(app: Flask):
+    """Set the JSON provider of the application, chosen by ``JSON_BACKEND``
+
+    Parameters
+    ----------
+    app: Flask
+        The application
+
+    Raises
+    ------
+    ValueError
+        If ``JSON_BACKEND`` is not ``"orjson"`` or ``"stdlib"``
+    """
+
+    if JSON_BACKEND == "orjson":
+        app.json = OrjsonJSONProvider(app)
+    elif JSON_BACKEND == "stdlib":
+        app.json = BsonJSONProvider(app)
+    else:
+        raise ValueError(f"Unknown JSON backend '{JSON_BACKEND}'")
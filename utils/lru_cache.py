@@ -0,0 +1,127 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after a time-to-live.
+
+    When the cache is full, the least recently used entry is evicted.
+    Hits, misses and evictions are counted and can be read with ``stats``.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """Create the cache
+
+        Parameters
+        ----------
+        max_size: int
+            The maximum number of entries
+        ttl: float
+            The default time-to-live of the entries, in seconds
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any | None:
+        """Get an entry from the cache
+
+        Parameters
+        ----------
+        key: Hashable
+            The key of the entry
+
+        Returns
+        -------
+        Any | None
+            The cached value, or ``None`` if it is missing or expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        """Put an entry into the cache
+
+        Parameters
+        ----------
+        key: Hashable
+            The key of the entry
+        value: Any
+            The value to cache, must not be ``None``
+        ttl: float | None
+            The time-to-live of this entry in seconds, the cache's default if ``None``
+        """
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Remove an entry from the cache, if it exists
+
+        Parameters
+        ----------
+        key: Hashable
+            The key of the entry
+        """
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry from the cache"""
+
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Get the cache's counters
+
+        Returns
+        -------
+        dict
+            The size, hit, miss and eviction counts of the cache
+        """
+
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
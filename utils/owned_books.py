@@ -0,0 +1,138 @@
+from os import environ
+
+import numpy as np
+from bson import ObjectId
+
+from services.database import db_provider
+from utils.concurrency import run_concurrently
+from utils.lru_cache import TTLCache
+
+# Owned books cache settings. Every worker process has its own cache, so writes
+# handled by another worker are seen here once the entry expires.
+OWNED_BOOKS_CACHE_SIZE = int(environ.get("OWNED_BOOKS_CACHE_SIZE", 10000))
+OWNED_BOOKS_CACHE_TTL = int(environ.get("OWNED_BOOKS_CACHE_TTL", 300))
+
+# ObjectIds are stored as their 12 raw bytes, see services.recommendation
+_OBJECT_ID_DTYPE = np.dtype("V12")
+
+owned_books_cache = TTLCache(max_size=OWNED_BOOKS_CACHE_SIZE, ttl=OWNED_BOOKS_CACHE_TTL)
+
+
+def to_raw_ids(book_ids) -> np.ndarray:
+    """Convert ObjectIds to a sorted array of their raw bytes, without duplicates
+
+    Parameters
+    ----------
+    book_ids: Iterable[ObjectId]
+        The ids to convert
+
+    Returns
+    -------
+    np.ndarray
+        The sorted raw ids
+    """
+
+    return np.unique(np.array([book_id.binary for book_id in book_ids], dtype=_OBJECT_ID_DTYPE))
+
+
+def contains(owned: np.ndarray, book_ids: np.ndarray) -> np.ndarray:
+    """Check which books are in a sorted raw id array
+
+    Parameters
+    ----------
+    owned: np.ndarray
+        The sorted raw ids, as returned by ``get_owned_book_ids``
+    book_ids: np.ndarray
+        The raw ids to look up
+
+    Returns
+    -------
+    np.ndarray
+        A boolean mask, ``True`` for the books in ``owned``
+    """
+
+    if len(owned) == 0:
+        return np.zeros(len(book_ids), dtype=bool)
+
+    positions = np.minimum(np.searchsorted(owned, book_ids), len(owned) - 1)
+
+    return owned[positions] == book_ids
+
+
+def _load_owned_book_ids(user_id: ObjectId) -> np.ndarray:
+    library_books, tracked_books = run_concurrently(
+        lambda: list(db_provider.col_book_libraries.aggregate([
+            {"$match": {"authorId": user_id}},
+            {"$unwind": "$books"},
+            {"$group": {"_id": "$books"}}
+        ])),
+        lambda: list(db_provider.col_book_tracking_statuses.find(
+            {"ownerUserId": user_id},
+            projection={"bookId": 1, "_id": 0}
+        ))
+    )
+
+    return to_raw_ids([
+        *(doc["_id"] for doc in library_books),
+        *(doc["bookId"] for doc in tracked_books)
+    ])
+
+
+def get_owned_book_ids(user_id: ObjectId) -> np.ndarray:
+    """Get the books the user has in any library or tracks, reading through the owned books cache
+
+    Parameters
+    ----------
+    user_id: ObjectId
+        The id of the user
+
+    Returns
+    -------
+    np.ndarray
+        The sorted raw ids of the books, use ``contains`` to look books up
+    """
+
+    owned = owned_books_cache.get(user_id)
+
+    if owned is None:
+        owned = _load_owned_book_ids(user_id)
+        owned_books_cache.set(user_id, owned)
+
+    return owned
+
+
+def add_owned_book(user_id: ObjectId, book_id: ObjectId):
+    """Add a book to the cached owned books of the user, if they are cached
+
+    Parameters
+    ----------
+    user_id: ObjectId
+        The id of the user
+    book_id: ObjectId
+        The id of the book that was added to a library or tracked
+    """
+
+    owned = owned_books_cache.get(user_id)
+
+    if owned is None:
+        return
+
+    raw_id = np.array([book_id.binary], dtype=_OBJECT_ID_DTYPE)
+
+    if not contains(owned, raw_id)[0]:
+        # Cached arrays are shared by concurrent requests, so a new array replaces the old one
+        owned_books_cache.set(user_id, np.insert(owned, np.searchsorted(owned, raw_id), raw_id))
+
+
+def invalidate_owned_books(user_id: ObjectId):
+    """Forget the cached owned books of the user
+
+    A removed book may still be in another library or tracked, so the next request reloads them.
+
+    Parameters
+    ----------
+    user_id: ObjectId
+        The id of the user
+    """
+
+    owned_books_cache.invalidate(user_id)
@@ -0,0 +1,124 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from datetime import datetime
+
+from bson import ObjectId
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(issued_at: datetime, doc_id: ObjectId) -> str:
+    """Encode the position of the last returned document into an opaque cursor
+
+    Parameters
+    ----------
+    issued_at: datetime
+        The ``issuedAt`` value of the last returned document
+    doc_id: ObjectId
+        The ``_id`` value of the last returned document
+
+    Returns
+    -------
+    str
+        The URL-safe cursor string
+    """
+
+    raw = json.dumps({"t": issued_at.isoformat(), "id": str(doc_id)}, separators=(",", ":"))
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    """Decode a cursor created by ``encode_cursor``
+
+    Parameters
+    ----------
+    cursor: str
+        The cursor string received from the client
+
+    Returns
+    -------
+    tuple[datetime, ObjectId]
+        The ``issuedAt`` and ``_id`` values of the last returned document
+
+    Raises
+    ------
+    InvalidCursorError
+        If the cursor is malformed
+    """
+
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = json.loads(urlsafe_b64decode(padded.encode()))
+
+        return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except (BinasciiError, ValueError, KeyError, TypeError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+
+def keyset_filter(cursor: str | None) -> dict:
+    """Build the query filter that selects documents after the cursor
+
+    Documents are expected to be sorted by ``(issuedAt, _id)`` in descending order.
+
+    Parameters
+    ----------
+    cursor: str | None
+        The cursor string, or ``None`` for the first page
+
+    Returns
+    -------
+    dict
+        The filter to merge into the query, empty for the first page
+
+    Raises
+    ------
+    InvalidCursorError
+        If the cursor is malformed
+    """
+
+    if cursor is None:
+        return {}
+
+    issued_at, doc_id = decode_cursor(cursor)
+
+    return {
+        "$or": [
+            {"issuedAt": {"$lt": issued_at}},
+            {"issuedAt": issued_at, "_id": {"$lt": doc_id}},
+        ]
+    }
+
+
+def parse_page_size(raw_value: str | None, default: int, maximum: int) -> int | None:
+    """Parse the page size query parameter
+
+    Parameters
+    ----------
+    raw_value: str | None
+        The raw query parameter value
+    default: int
+        The value to use if the parameter is missing
+    maximum: int
+        The largest accepted page size
+
+    Returns
+    -------
+    int | None
+        The page size, or ``None`` if the value is invalid
+    """
+
+    if raw_value is None:
+        return default
+
+    try:
+        page_size = int(raw_value)
+    except ValueError:
+        return None
+
+    if page_size < 1 or page_size > maximum:
+        return None
+
+    return page_size
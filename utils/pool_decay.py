@@ -0,0 +1,152 @@
+from datetime import datetime, timezone
+from os import environ
+from typing import Callable
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from services.database import db_provider
+from utils.pool_ops import DECAY_AMOUNT
+
+# Decay job settings
+POOL_DECAY_CHUNK_SIZE = int(environ.get("POOL_DECAY_CHUNK_SIZE", 1000))
+
+_CHECKPOINT_ID = "poolDecay"
+
+
+def build_decay_operations(pools: list[dict], run_id: ObjectId) -> list[UpdateOne]:
+    """Build the updates that decay the category weights of a chunk of pools
+
+    The weights of the chunk are laid out as a users x categories matrix, and every weight
+    is decreased by ``DECAY_AMOUNT`` at once, without going below zero.
+    The decrements are written with ``$inc``, so likes applied while the job runs are kept.
+    A pool is only updated if it has not been decayed in the same run yet,
+    which makes a resumed run safe to repeat on the chunk it was interrupted on.
+
+    Parameters
+    ----------
+    pools: list[dict]
+        The pool documents, with their ``_id`` and ``categories`` fields
+    run_id: ObjectId
+        The id of the decay run
+
+    Returns
+    -------
+    list[UpdateOne]
+        The updates of the pools that have a weight to decay
+    """
+
+    categories = sorted({
+        category
+        for pool in pools
+        for category in pool.get("categories", {})
+        # Categories are used in field paths, which can't contain dots or start with a dollar sign
+        if "." not in category and not category.startswith("$")
+    })
+
+    if not categories:
+        return []
+
+    columns = {category: column for column, category in enumerate(categories)}
+    weights = np.zeros((len(pools), len(categories)), dtype=np.int64)
+
+    for row, pool in enumerate(pools):
+        for category, weight in pool.get("categories", {}).items():
+            if category in columns:
+                weights[row, columns[category]] = weight
+
+    decrements = np.clip(weights, 0, DECAY_AMOUNT)
+
+    # Row-major order keeps every user's decrements together
+    rows, columns_to_decay = np.nonzero(decrements)
+    amounts = -decrements[rows, columns_to_decay]
+
+    fields = [f"categories.{category}" for category in categories]
+    increments_by_row: dict[int, dict[str, int]] = {}
+
+    for row, column, amount in zip(rows.tolist(), columns_to_decay.tolist(), amounts.tolist()):
+        increments_by_row.setdefault(row, {})[fields[column]] = amount
+
+    operations = [
+        UpdateOne(
+            {"_id": pools[row]["_id"], "lastDecayRunId": {"$ne": run_id}},
+            {"$inc": increments, "$set": {"lastDecayRunId": run_id}}
+        )
+        for row, increments in increments_by_row.items()
+    ]
+
+    return operations
+
+
+def decay_pools(chunk_size: int = POOL_DECAY_CHUNK_SIZE, on_progress: Callable[[int], None] | None = None) -> int:
+    """Decay the category weights of every user by ``DECAY_AMOUNT``
+
+    The pools are read in ``_id`` order, one chunk at a time, and every chunk is written back
+    with a single unordered ``bulk_write``. Progress is checkpointed in the ``jobCheckpoints``
+    collection after every chunk, so a run that was interrupted is resumed where it stopped.
+
+    Parameters
+    ----------
+    chunk_size: int
+        The number of pools to read and write at once
+    on_progress: Callable[[int], None] | None
+        Called with the number of processed pools after every chunk
+
+    Returns
+    -------
+    int
+        The number of processed pools, including the ones processed before a resume
+    """
+
+    checkpoint = db_provider.col_job_checkpoints.find_one({"_id": _CHECKPOINT_ID, "finishedAt": None})
+
+    if checkpoint is None:
+        checkpoint = {
+            "_id": _CHECKPOINT_ID,
+            "runId": ObjectId(),
+            "lastPoolId": None,
+            "processed": 0,
+            "startedAt": datetime.now(tz=timezone.utc),
+            "finishedAt": None
+        }
+        db_provider.col_job_checkpoints.replace_one({"_id": _CHECKPOINT_ID}, checkpoint, upsert=True)
+
+    run_id = checkpoint["runId"]
+    last_pool_id = checkpoint["lastPoolId"]
+    processed = checkpoint["processed"]
+
+    while True:
+        query = {} if last_pool_id is None else {"_id": {"$gt": last_pool_id}}
+
+        pools = list(
+            db_provider.col_pools.find(query, projection={"categories": 1})
+            .sort("_id", ASCENDING)
+            .limit(chunk_size)
+        )
+
+        if not pools:
+            break
+
+        operations = build_decay_operations(pools, run_id)
+
+        if operations:
+            db_provider.col_pools.bulk_write(operations, ordered=False)
+
+        last_pool_id = pools[-1]["_id"]
+        processed += len(pools)
+
+        db_provider.col_job_checkpoints.update_one(
+            {"_id": _CHECKPOINT_ID},
+            {"$set": {"lastPoolId": last_pool_id, "processed": processed}}
+        )
+
+        if on_progress is not None:
+            on_progress(processed)
+
+    db_provider.col_job_checkpoints.update_one(
+        {"_id": _CHECKPOINT_ID},
+        {"$set": {"finishedAt": datetime.now(tz=timezone.utc)}}
+    )
+
+    return processed
@@ -1,65 +1,222 @@
+import atexit
+import logging
+import os
+import random
+from collections import Counter
+from os import environ
+from threading import Event, Lock, Thread
+
+import numpy as np
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
 
 from services.database import db_provider
-from random import shuffle
+from utils import book_sampling, co_liked_books
+
+logger = logging.getLogger(__name__)
 
 # Pool settings
 SATURATION_LIMIT = 50
 WEIGHT_LIMIT = 100
 ADD_AMOUNT = 5
 DECAY_AMOUNT = 1
-DECAY_INTERVAL = 2
+
+# Write-behind settings, likes are applied to the pools at most this many seconds later
+POOL_UPDATE_FLUSH_INTERVAL = float(environ.get("POOL_UPDATE_FLUSH_INTERVAL", 1))
+POOL_UPDATE_MAX_PENDING_USERS = int(environ.get("POOL_UPDATE_MAX_PENDING_USERS", 1000))
+POOL_UPDATE_MAX_RETRIES = int(environ.get("POOL_UPDATE_MAX_RETRIES", 3))
 
 # Recommendation settings
 RECOMMENDATION_SAMPLE_SIZE = 10
 RECOMMENDATION_PERSONALIZED_MAX_PORTION = 0.8
 
+# Portion of the recommendations taken from the books liked together with the user's likes
+RECOMMENDATION_CF_PORTION = float(environ.get("RECOMMENDATION_CF_PORTION", 0.3))
+
+
+# user id -> liked book id -> number of likes, waiting to be applied to the pools
+_pending_likes: dict[ObjectId, Counter] = {}
+# user id -> number of times applying the user's pending likes failed
+_failure_counts: dict[ObjectId, int] = {}
+_pending_lock = Lock()
+_flush_requested = Event()
+_flusher_pid: int | None = None
+
+
+def _reset_after_fork():
+    # The parent's pending likes are applied by the parent, and its flusher thread doesn't exist in the child
+    global _pending_likes, _failure_counts, _pending_lock, _flush_requested, _flusher_pid
+
+    _pending_likes = {}
+    _failure_counts = {}
+    _pending_lock = Lock()
+    _flush_requested = Event()
+    _flusher_pid = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _start_flusher():
+    global _flusher_pid
+
+    if _flusher_pid == os.getpid():
+        return
+
+    with _pending_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            Thread(target=_flush_periodically, name="pool-update-flush", daemon=True).start()
+
+
+def _flush_periodically():
+    while True:
+        # Woken up early when too many users are pending
+        _flush_requested.wait(POOL_UPDATE_FLUSH_INTERVAL)
+        _flush_requested.clear()
+        flush_pool_updates()
+
 
 def add_weight_to_category(user_id: str, book_id: str):
-    pool_entry = db_provider.col_pools.find_one({"userId": (ObjectId(user_id))})
+    """Queue a like, to add weight to the category of the liked book in the user's pool
+
+    Likes are buffered in memory and applied in the background by ``flush_pool_updates``,
+    so the request doesn't wait for the pool update. Once ``POOL_UPDATE_MAX_PENDING_USERS``
+    users are pending, the background thread is woken up to apply them early.
+
+    Parameters
+    ----------
+    user_id: str
+        The id of the user who liked the book
+    book_id: str
+        The id of the liked book
+    """
+
+    _start_flusher()
+
+    with _pending_lock:
+        _pending_likes.setdefault(ObjectId(user_id), Counter())[ObjectId(book_id)] += 1
+        pending_user_count = len(_pending_likes)
+
+    if pending_user_count >= POOL_UPDATE_MAX_PENDING_USERS:
+        _flush_requested.set()
+
+
+def _build_pool_update(category_likes: Counter) -> list[dict]:
+    """Build the update pipeline that applies likes to a pool document
+
+    Every weight is increased by ``ADD_AMOUNT`` per like, capped at ``WEIGHT_LIMIT``,
+    and saturation is increased by one per like, capped at ``SATURATION_LIMIT``.
+    Everything is computed on the server, so concurrent updates never overwrite each other.
+    Weights are decayed separately, by ``utils.pool_decay.decay_pools``.
+    """
+
+    return [
+        {"$set": {
+            "saturation": {"$min": [
+                SATURATION_LIMIT,
+                {"$add": [{"$ifNull": ["$saturation", 0]}, category_likes.total()]}
+            ]},
+            **{
+                f"categories.{category}": {"$min": [
+                    WEIGHT_LIMIT,
+                    {"$add": [{"$ifNull": [f"$categories.{category}", 0]}, like_count * ADD_AMOUNT]}
+                ]}
+                for category, like_count in category_likes.items()
+            }
+        }}
+    ]
 
-    if pool_entry is None:
-        pool_entry = {
-            "userId": ObjectId(user_id),
-            "saturation": 1,
-            "categories": {}
-        }
-
-    book = db_provider.col_raw_book_datas.find_one(
-        {"_id": ObjectId(book_id)},
-        projection={"category": 1}
-    )
-
-    if book is None:
+
+def flush_pool_updates():
+    """Apply the queued likes to the pools
+
+    The likes are coalesced per user and category, and applied with a single unordered ``bulk_write``
+    of atomic update pipelines. Likes of users whose update failed are queued again,
+    and dropped after ``POOL_UPDATE_MAX_RETRIES`` failed retries.
+    """
+
+    global _pending_likes, _failure_counts
+
+    with _pending_lock:
+        pending_likes, _pending_likes = _pending_likes, {}
+        failure_counts, _failure_counts = _failure_counts, {}
+
+    if not pending_likes:
         return
 
-    category = book["category"]
+    try:
+        _apply_likes(pending_likes, failure_counts)
+    except PyMongoError:
+        logger.exception("Applying the queued likes to the pools failed")
+        _requeue_likes(pending_likes, failure_counts)
 
-    current_weight = pool_entry["categories"].get(category, 0)
-    new_weight = current_weight + ADD_AMOUNT
 
-    if new_weight > WEIGHT_LIMIT:
-        new_weight = WEIGHT_LIMIT
+def _apply_likes(pending_likes: dict[ObjectId, Counter], failure_counts: dict[ObjectId, int]):
+    book_ids = list({book_id for liked_books in pending_likes.values() for book_id in liked_books})
 
-    pool_entry["categories"][category] = new_weight
+    book_categories = {
+        book["_id"]: book["category"]
+        for book in db_provider.col_book_summaries.find({"_id": {"$in": book_ids}}, projection={"category": 1})
+        # Categories are used in field paths, which can't contain dots or start with a dollar sign
+        if book.get("category") and "." not in book["category"] and not book["category"].startswith("$")
+    }
+
+    user_ids = []
+    operations = []
 
-    pool_entry["saturation"] = pool_entry["saturation"] + 1
+    for user_id, liked_books in pending_likes.items():
+        category_likes = Counter()
 
-    if pool_entry["saturation"] >= SATURATION_LIMIT + DECAY_INTERVAL:
-        for key in pool_entry["categories"]:
-            decayed_weight = pool_entry["categories"][key] - DECAY_AMOUNT
+        for book_id, like_count in liked_books.items():
+            if book_id in book_categories:
+                category_likes[book_categories[book_id]] += like_count
 
-            if decayed_weight < 0:
-                decayed_weight = 0
+        if not category_likes:
+            continue
 
-            pool_entry["categories"][key] = decayed_weight
+        user_ids.append(user_id)
+        operations.append(UpdateOne({"userId": user_id}, _build_pool_update(category_likes), upsert=True))
 
-        pool_entry["saturation"] = SATURATION_LIMIT
+    if not operations:
+        return
 
-    db_provider.col_pools.update_one({"userId": ObjectId(user_id)}, {"$set": pool_entry}, upsert=True)
+    try:
+        db_provider.col_pools.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        failed_user_ids = {user_ids[error["index"]] for error in e.details["writeErrors"]}
+        logger.warning("Applying the queued likes of %d users to the pools failed", len(failed_user_ids))
+        _requeue_likes({user_id: pending_likes[user_id] for user_id in failed_user_ids}, failure_counts)
 
 
-def get_personalized_recommendations(user_id: str) -> list | None:
+def _requeue_likes(failed_likes: dict[ObjectId, Counter], failure_counts: dict[ObjectId, int]):
+    dropped_user_count = 0
+
+    with _pending_lock:
+        for user_id, liked_books in failed_likes.items():
+            failure_count = failure_counts.get(user_id, 0) + 1
+
+            # Retrying forever would grow the queue without bound while the database is failing
+            if failure_count > POOL_UPDATE_MAX_RETRIES:
+                dropped_user_count += 1
+                continue
+
+            _pending_likes.setdefault(user_id, Counter()).update(liked_books)
+            _failure_counts[user_id] = failure_count
+
+    if dropped_user_count:
+        logger.warning(
+            "Dropped the queued likes of %d users after %d failed retries",
+            dropped_user_count, POOL_UPDATE_MAX_RETRIES
+        )
+
+
+# Don't lose the queued likes on a clean shutdown
+atexit.register(flush_pool_updates)
+
+
+def get_personalized_recommendations(user_id: str, exclude: np.ndarray | None = None) -> list | None:
     pool_entry = db_provider.col_pools.find_one({"userId": ObjectId(user_id)})
 
     if pool_entry is None:
@@ -73,90 +230,73 @@ def get_personalized_recommendations(user_id: str) -> list | None:
     saturation = pool_entry["saturation"]
     personalized_portion = min(saturation / SATURATION_LIMIT, RECOMMENDATION_PERSONALIZED_MAX_PORTION)
 
-    # Take 3 categories with the highest weights
-    categories: list[tuple[str, float]] = list(pool_entry["categories"].items())
+    # Split the personalized books between the categories proportionally to their weights
+    categories = list(pool_entry["categories"].keys())
+    weights = np.array(list(pool_entry["categories"].values()), dtype=np.float64)
 
-    # Calculate total weight of the selected categories
-    total_weight = sum(weight for _, weight in categories)
+    if weights.sum() <= 0:
+        return None
 
-    # Calculate the book count for each category
-    personalized_book_counts = {}
+    personalized_book_count = int(RECOMMENDATION_SAMPLE_SIZE * personalized_portion)
+    category_book_counts = np.random.default_rng().multinomial(personalized_book_count, weights / weights.sum())
 
-    for category, weight in categories:
-        portion = weight / total_weight * personalized_portion
-        book_count = int(RECOMMENDATION_SAMPLE_SIZE * portion)
+    # Take the rest of the books randomly
+    random_book_count = RECOMMENDATION_SAMPLE_SIZE - personalized_book_count
 
-        personalized_book_counts[category] = book_count
+    return book_sampling.sample_eligible_books_by_category({
+        None: random_book_count,
+        **dict(zip(categories, category_book_counts.tolist()))
+    }, exclude=exclude)
 
-    # Calculate how many random books to take
-    sum_personalized_book_counts = sum(personalized_book_counts.values())
-    random_book_count = RECOMMENDATION_SAMPLE_SIZE - sum_personalized_book_counts
 
-    # Prepare aggregation facets
-    facets = {
-        "randomSamples": [
-            {
-                "$sample": {"size": random_book_count}
-            }
-        ]
-    }
+def get_co_liked_recommendations(user_id: str, exclude: np.ndarray | None = None) -> list[dict]:
+    """Get the books that are most liked together with the books the user liked recently
 
-    for category, book_count in personalized_book_counts.items():
-        facets[category] = [
-            {
-                "$match": {
-                    "category": category
-                }
-            },
-            {
-                "$sample": {"size": book_count}
-            }
-        ]
-
-    # Aggregate books
-    aggregation = [
-        {
-            "$match": {
-                "volumeInfo.maturityRating": {
-                    "$ne": "MATURE"
-                },
-                "volumeInfo.description": {
-                    "$exists": True,
-                    "$ne": ""
-                }
-            }
-        },
-        {
-            "$facet": facets
-        },
-        {
-            "$project": {
-                "books": {
-                    "$concatArrays": [
-                        "$randomSamples",
-                        *[
-                            f"${category}" for category in personalized_book_counts
-                        ]
-                    ]
-                }
-            }
-        },
-        {
-            '$unwind': {
-                'path': '$books'
-            }
-        },
-        {
-            '$project': {
-                'bookId': '$books._id',
-                'title': '$books.volumeInfo.title',
-                'authors': '$books.volumeInfo.authors',
-                'description': '$books.volumeInfo.description',
-                'thumbnail': '$books.volumeInfo.imageLinks.thumbnail'
-            }
-        }
-    ]
+    Parameters
+    ----------
+    user_id: str
+        The id of the user
+    exclude: np.ndarray | None
+        Sorted raw ids of the books not to pick, see ``utils.owned_books``
+
+    Returns
+    -------
+    list[dict]
+        At most ``RECOMMENDATION_CF_PORTION`` of ``RECOMMENDATION_SAMPLE_SIZE`` books, best first
+    """
+
+    size = int(RECOMMENDATION_SAMPLE_SIZE * RECOMMENDATION_CF_PORTION)
+
+    if size <= 0:
+        return []
+
+    excluded_ids = None if exclude is None else {ObjectId(bytes(raw_id)) for raw_id in exclude}
+    book_ids = co_liked_books.get_co_liked_book_ids(ObjectId(user_id), size, exclude=excluded_ids)
+    books = {book["bookId"]: book for book in book_sampling.fetch_recommendations(book_ids)}
+
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+
+def blend_recommendations(recommendations: list[dict], co_liked_recommendations: list[dict]) -> list[dict]:
+    """Replace a part of the recommendations with the co-liked books
+
+    Parameters
+    ----------
+    recommendations: list[dict]
+        The recommendations to replace a part of, see ``get_personalized_recommendations``
+    co_liked_recommendations: list[dict]
+        The books liked together with the user's likes, see ``get_co_liked_recommendations``
+
+    Returns
+    -------
+    list[dict]
+        At most ``RECOMMENDATION_SAMPLE_SIZE`` books without duplicates, in random order
+    """
+
+    co_liked_ids = {book["bookId"] for book in co_liked_recommendations}
+    others = [book for book in recommendations if book["bookId"] not in co_liked_ids]
 
-    results = db_provider.col_raw_book_datas.aggregate(aggregation)
+    blended = co_liked_recommendations + others[:max(RECOMMENDATION_SAMPLE_SIZE - len(co_liked_recommendations), 0)]
+    random.shuffle(blended)
 
-    return shuffle(list(results))
+    return blended
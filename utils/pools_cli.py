@@ -0,0 +1,19 @@
+import click
+from flask.cli import AppGroup
+
+pools_cli = AppGroup("pools", help="Recommendation pool maintenance commands.")
+
+
+@pools_cli.command("decay")
+@click.option("--chunk-size", type=int, default=None, help="Number of pools to read and write at once.")
+def decay_command(chunk_size: int | None):
+    """Decay the category weights of every user, resuming an interrupted run."""
+
+    from utils.pool_decay import POOL_DECAY_CHUNK_SIZE, decay_pools
+
+    processed = decay_pools(
+        chunk_size=chunk_size or POOL_DECAY_CHUNK_SIZE,
+        on_progress=lambda count: click.echo(f"Processed pools: {count}")
+    )
+
+    click.echo(f"Decayed pools: {processed}")
@@ -0,0 +1,55 @@
+import statistics
+import time
+
+import click
+from flask.cli import AppGroup
+
+# noinspection PyPackageRequirements
+import argon2
+
+pw_cli = AppGroup("passwords", help="Password hashing commands.")
+
+CALIBRATION_SAMPLES = 5
+MAX_TIME_COST = 20
+
+
+def _measure_hash_ms(time_cost: int, memory_cost: int, parallelism: int) -> float:
+    hasher = argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    durations = []
+
+    for _ in range(CALIBRATION_SAMPLES):
+        start = time.perf_counter()
+        hasher.hash("calibration-password")
+        durations.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(durations)
+
+
+@pw_cli.command("calibrate")
+@click.option("--target-ms", default=250, show_default=True, help="Target hashing latency in milliseconds.")
+@click.option("--memory-cost", default=argon2.DEFAULT_MEMORY_COST, show_default=True, help="Memory cost in KiB.")
+@click.option("--parallelism", default=argon2.DEFAULT_PARALLELISM, show_default=True, help="Number of lanes.")
+def calibrate_command(target_ms: int, memory_cost: int, parallelism: int):
+    """Pick the Argon2 time and memory costs that hash in about the target latency on this host.
+
+    The time cost is raised until a hash takes at least the target latency.
+    If a single pass is already slower than the target, the memory cost is halved instead.
+    """
+
+    time_cost = 1
+    duration = _measure_hash_ms(time_cost, memory_cost, parallelism)
+
+    while duration > target_ms and memory_cost // 2 >= 8 * parallelism:
+        memory_cost //= 2
+        duration = _measure_hash_ms(time_cost, memory_cost, parallelism)
+
+    while duration < target_ms and time_cost < MAX_TIME_COST:
+        time_cost += 1
+        duration = _measure_hash_ms(time_cost, memory_cost, parallelism)
+
+    click.echo(f"Median hashing latency: {duration:.1f} ms")
+    click.echo("Set these environment variables to use the calibrated parameters:")
+    click.echo(f"ARGON2_TIME_COST={time_cost}")
+    click.echo(f"ARGON2_MEMORY_COST={memory_cost}")
+    click.echo(f"ARGON2_PARALLELISM={parallelism}")
+    click.echo("Existing password hashes are rehashed with them when their users log in.")
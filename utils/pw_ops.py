@@ -1,12 +1,133 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from os import environ
+from threading import BoundedSemaphore, Lock
+
 # noinspection PyPackageRequirements
 import argon2
 
-pw_hasher = argon2.PasswordHasher()
+# Argon2 settings, use "flask passwords calibrate" to pick them for a host
+ARGON2_TIME_COST = int(environ.get("ARGON2_TIME_COST", argon2.DEFAULT_TIME_COST))
+ARGON2_MEMORY_COST = int(environ.get("ARGON2_MEMORY_COST", argon2.DEFAULT_MEMORY_COST))
+ARGON2_PARALLELISM = int(environ.get("ARGON2_PARALLELISM", argon2.DEFAULT_PARALLELISM))
+
+# Hashing pool settings
+PW_HASH_WORKERS = int(environ.get("PW_HASH_WORKERS", os.cpu_count() or 1))
+PW_HASH_QUEUE_LIMIT = int(environ.get("PW_HASH_QUEUE_LIMIT", PW_HASH_WORKERS * 4))
+PW_HASH_TIMEOUT = float(environ.get("PW_HASH_TIMEOUT", 10))
+PW_HASH_RETRY_AFTER = int(environ.get("PW_HASH_RETRY_AFTER", 1))
+
+pw_hasher = argon2.PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM
+)
+
+_executor: ProcessPoolExecutor | None = None
+_executor_lock = Lock()
+
+# Admits the running and the queued hashing jobs
+_admission = BoundedSemaphore(PW_HASH_WORKERS + PW_HASH_QUEUE_LIMIT)
+
+
+def _reset_after_fork():
+    # The parent's worker processes and their management thread are not usable from a forked child
+    global _executor, _executor_lock, _admission
+
+    _executor = None
+    _executor_lock = Lock()
+    _admission = BoundedSemaphore(PW_HASH_WORKERS + PW_HASH_QUEUE_LIMIT)
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class HashingPoolUnavailableError(Exception):
+    """Raised when the password hashing pool can't hash or verify a password right now.
+
+    Routes should respond with ``503`` and a ``Retry-After`` header of ``PW_HASH_RETRY_AFTER`` seconds.
+    """
+
+
+class HashingPoolSaturatedError(HashingPoolUnavailableError):
+    """Raised when the password hashing pool has no room for another job."""
+
+
+def _hash_in_worker(password: str) -> str:
+    return pw_hasher.hash(password)
+
+
+def _verify_in_worker(password: str, hashed_pw: str) -> bool:
+    try:
+        return pw_hasher.verify(hashed_pw, password)
+    except argon2.exceptions.VerifyMismatchError:
+        return False
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # Workers are spawned instead of forked, so they don't inherit the server's threads and sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=PW_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+
+        return _executor
+
+
+def _replace_broken_executor(executor: ProcessPoolExecutor):
+    global _executor
+
+    with _executor_lock:
+        # Another thread may have replaced it already
+        if _executor is executor:
+            _executor = None
+
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_in_pool(fn, *args):
+    if not _admission.acquire(blocking=False):
+        raise HashingPoolSaturatedError("Password hashing pool is saturated")
+
+    try:
+        executor = _get_executor()
+
+        try:
+            future: Future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # The pool broke since its last job, the job can run on a new one
+            _replace_broken_executor(executor)
+            executor = _get_executor()
+            future = executor.submit(fn, *args)
+    except BaseException:
+        _admission.release()
+        raise
+
+    future.add_done_callback(lambda _: _admission.release())
+
+    try:
+        return future.result(timeout=PW_HASH_TIMEOUT)
+    except FutureTimeoutError as e:
+        # Only a queued job can be cancelled, a running one still holds its admission until it finishes
+        future.cancel()
+        raise HashingPoolUnavailableError("Password hashing timed out") from e
+    except BrokenProcessPool as e:
+        # A worker died, e.g. killed for running out of memory, and the pool can't run jobs anymore
+        _replace_broken_executor(executor)
+        raise HashingPoolUnavailableError("Password hashing pool is broken") from e
 
 
 def hash_password(password: str) -> str:
     """Hash the password using the ``argon2`` algorithm
 
+    Hashing runs in a separate worker process, so it doesn't block the request workers.
+
     Parameters
     ----------
     password: str
@@ -16,14 +137,23 @@ def hash_password(password: str) -> str:
     -------
     str
         The hashed password
+
+    Raises
+    ------
+    HashingPoolSaturatedError
+        If the hashing pool and its queue are full
+    HashingPoolUnavailableError
+        If hashing takes longer than ``PW_HASH_TIMEOUT`` seconds or the pool is broken
     """
 
-    return pw_hasher.hash(password)
+    return _run_in_pool(_hash_in_worker, password)
 
 
 def verify_password(password: str, hashed_pw: str) -> bool:
     """Verify the password against the hashed password
 
+    Verification runs in a separate worker process, so it doesn't block the request workers.
+
     Parameters
     ----------
     password: str
@@ -35,10 +165,30 @@ def verify_password(password: str, hashed_pw: str) -> bool:
     -------
     bool
         ``True`` if the password matches the hashed password, ``False`` otherwise
+
+    Raises
+    ------
+    HashingPoolSaturatedError
+        If the hashing pool and its queue are full
+    HashingPoolUnavailableError
+        If hashing takes longer than ``PW_HASH_TIMEOUT`` seconds or the pool is broken
     """
 
-    try:
-        pw_hasher.verify(hashed_pw, password)
-        return True
-    except argon2.exceptions.VerifyMismatchError:
-        return False
+    return _run_in_pool(_verify_in_worker, password, hashed_pw)
+
+
+def password_needs_rehash(hashed_pw: str) -> bool:
+    """Check if the hashed password was created with different ``argon2`` parameters
+
+    Parameters
+    ----------
+    hashed_pw: str
+        The hashed password to check
+
+    Returns
+    -------
+    bool
+        ``True`` if the password should be hashed again with the current parameters
+    """
+
+    return pw_hasher.check_needs_rehash(hashed_pw)
@@ -0,0 +1,308 @@
+import zlib
+from datetime import datetime, timezone
+from os import environ
+from typing import Callable
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from scipy import sparse
+
+from services.database import db_provider
+from services.search import tokenize
+
+# Similar books settings
+SIMILAR_BOOKS_COUNT = int(environ.get("SIMILAR_BOOKS_COUNT", 20))
+SIMILAR_BOOKS_CHUNK_SIZE = int(environ.get("SIMILAR_BOOKS_CHUNK_SIZE", 1000))
+SIMILAR_BOOKS_BLOCK_SIZE = int(environ.get("SIMILAR_BOOKS_BLOCK_SIZE", 20000))
+
+# Only the highest weighted terms of a book are kept, so memory grows linearly with the catalog
+SIMILAR_BOOKS_MAX_TERMS = 64
+
+# Terms that appear in more than this portion of the books say nothing about similarity
+SIMILAR_BOOKS_MAX_DOCUMENT_FREQUENCY = 0.5
+
+# Terms are hashed into a fixed number of features, so no vocabulary has to be kept in memory
+_FEATURE_COUNT = 2 ** 20
+
+_BOOK_TEXT_PROJECTION = {
+    "title": 1,
+    "authors": 1,
+    "description": 1
+}
+
+_NEIGHBOUR_PROJECTION = {
+    "title": 1,
+    "authors": 1,
+    "thumbnail": 1
+}
+
+
+def _book_features(book: dict) -> tuple[np.ndarray, np.ndarray]:
+    text = " ".join([
+        book.get("title") or "",
+        " ".join(book.get("authors") or []),
+        book.get("description") or ""
+    ])
+
+    # crc32 is stable across processes, unlike hash()
+    hashed = np.fromiter(
+        (zlib.crc32(token.encode()) for token in tokenize(text)),
+        dtype=np.int64
+    ) % _FEATURE_COUNT
+
+    return np.unique(hashed, return_counts=True)
+
+
+def _count_document_frequencies() -> tuple[list[ObjectId], np.ndarray]:
+    book_ids = []
+    document_frequencies = np.zeros(_FEATURE_COUNT, dtype=np.int32)
+
+    for book in db_provider.col_book_summaries.find({}, projection=_BOOK_TEXT_PROJECTION):
+        features, _ = _book_features(book)
+        document_frequencies[features] += 1
+        book_ids.append(book["_id"])
+
+    return book_ids, document_frequencies
+
+
+def _build_tfidf_matrix(book_ids: list[ObjectId], document_frequencies: np.ndarray) -> sparse.csr_matrix:
+    """Build the L2 normalized TF-IDF vectors of the books, one row per book in ``book_ids`` order"""
+
+    book_count = len(book_ids)
+    rows = {book_id: row for row, book_id in enumerate(book_ids)}
+
+    idf = np.log((1 + book_count) / (1 + document_frequencies)).astype(np.float32) + 1
+    idf[document_frequencies > SIMILAR_BOOKS_MAX_DOCUMENT_FREQUENCY * book_count] = 0
+
+    indptr = np.zeros(book_count + 1, dtype=np.int64)
+    row_features: list[np.ndarray | None] = [None] * book_count
+    row_weights: list[np.ndarray | None] = [None] * book_count
+
+    for book in db_provider.col_book_summaries.find({}, projection=_BOOK_TEXT_PROJECTION):
+        row = rows.get(book["_id"])
+
+        # Books imported after the first pass are picked up by the next refresh
+        if row is None:
+            continue
+
+        features, counts = _book_features(book)
+        weights = (1 + np.log(counts)).astype(np.float32) * idf[features]
+
+        if len(weights) > SIMILAR_BOOKS_MAX_TERMS:
+            kept = np.argpartition(weights, -SIMILAR_BOOKS_MAX_TERMS)[-SIMILAR_BOOKS_MAX_TERMS:]
+            features, weights = features[kept], weights[kept]
+
+        nonzero = weights > 0
+        row_features[row], row_weights[row] = features[nonzero], weights[nonzero]
+
+    empty = np.empty(0, dtype=np.int64)
+
+    for row in range(book_count):
+        if row_features[row] is None:
+            row_features[row], row_weights[row] = empty, empty.astype(np.float32)
+
+        indptr[row + 1] = indptr[row] + len(row_features[row])
+
+    matrix = sparse.csr_matrix(
+        (
+            np.concatenate(row_weights) if book_count else np.empty(0, dtype=np.float32),
+            np.concatenate(row_features) if book_count else empty,
+            indptr
+        ),
+        shape=(book_count, _FEATURE_COUNT)
+    )
+    matrix.sort_indices()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+
+    return sparse.diags(1 / norms).astype(np.float32) @ matrix
+
+
+def _top_neighbours(matrix: sparse.csr_matrix, query_rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Find the most similar books of the queried rows
+
+    The cosine similarities are computed against one block of books at a time,
+    so the dense intermediate is at most ``len(query_rows) x SIMILAR_BOOKS_BLOCK_SIZE``.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The rows and the scores of the neighbours, ``len(query_rows) x SIMILAR_BOOKS_COUNT``,
+        best first. Missing neighbours have a score of zero.
+    """
+
+    queries = matrix[query_rows]
+    neighbour_count = min(SIMILAR_BOOKS_COUNT, matrix.shape[0])
+
+    best_rows = np.zeros((len(query_rows), 0), dtype=np.int64)
+    best_scores = np.zeros((len(query_rows), 0), dtype=np.float32)
+
+    for block_start in range(0, matrix.shape[0], SIMILAR_BOOKS_BLOCK_SIZE):
+        block_end = min(block_start + SIMILAR_BOOKS_BLOCK_SIZE, matrix.shape[0])
+        scores = (queries @ matrix[block_start:block_end].T).toarray()
+
+        # A book is not similar to itself
+        in_block = (query_rows >= block_start) & (query_rows < block_end)
+        scores[np.flatnonzero(in_block), query_rows[in_block] - block_start] = 0
+
+        candidate_rows = np.hstack([best_rows, np.broadcast_to(np.arange(block_start, block_end), scores.shape)])
+        candidate_scores = np.hstack([best_scores, scores])
+
+        kept_count = min(neighbour_count, candidate_scores.shape[1])
+        kept = np.argpartition(-candidate_scores, kept_count - 1, axis=1)[:, :kept_count]
+        best_rows = np.take_along_axis(candidate_rows, kept, axis=1)
+        best_scores = np.take_along_axis(candidate_scores, kept, axis=1)
+
+    order = np.argsort(-best_scores, axis=1)
+
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def _to_neighbour(book: dict, score: float) -> dict:
+    return {
+        "bookId": book["_id"],
+        "title": book["title"],
+        "authors": book.get("authors", []),
+        "thumbnail": book.get("thumbnail"),
+        "score": round(score, 4)
+    }
+
+
+def build_similar_books(only_new: bool = False, on_progress: Callable[[int], None] | None = None) -> int:
+    """Build the table of similar books, served by ``get_similar_books``
+
+    Books are compared by the cosine similarity of their TF-IDF vectors, made from their title,
+    authors and description. The vectors of the whole catalog are built in two streaming passes,
+    keeping at most ``SIMILAR_BOOKS_MAX_TERMS`` terms per book. The neighbours are then computed
+    and written for one chunk of ``SIMILAR_BOOKS_CHUNK_SIZE`` books at a time, against one block of
+    ``SIMILAR_BOOKS_BLOCK_SIZE`` books at a time, so the similarity matrix is never held in memory.
+
+    The neighbours are stored with the summaries of the books, so serving them is a single read.
+    Every book's neighbours are stamped with ``builtAt``, so a full build removes the books
+    that no longer exist by deleting the ones it didn't write.
+
+    Parameters
+    ----------
+    only_new: bool
+        Whether to only build the neighbours of the books that have none yet, like newly imported ones.
+        The new books are also added to the neighbours of their own neighbours.
+    on_progress: Callable[[int], None] | None
+        Called with the number of processed books after every chunk
+
+    Returns
+    -------
+    int
+        The number of books whose neighbours were built
+    """
+
+    book_ids, document_frequencies = _count_document_frequencies()
+
+    if not book_ids:
+        if not only_new:
+            db_provider.col_similar_books.delete_many({})
+
+        return 0
+
+    matrix = _build_tfidf_matrix(book_ids, document_frequencies)
+
+    if only_new:
+        existing = {doc["_id"] for doc in db_provider.col_similar_books.find({}, projection={"_id": 1})}
+        query_rows = np.array([row for row, book_id in enumerate(book_ids) if book_id not in existing], dtype=np.int64)
+    else:
+        query_rows = np.arange(len(book_ids), dtype=np.int64)
+
+    new_book_ids = {book_ids[row] for row in query_rows.tolist()}
+    built_at = datetime.now(tz=timezone.utc)
+    processed = 0
+
+    for chunk_start in range(0, len(query_rows), SIMILAR_BOOKS_CHUNK_SIZE):
+        chunk_rows = query_rows[chunk_start:chunk_start + SIMILAR_BOOKS_CHUNK_SIZE]
+        neighbour_rows, neighbour_scores = _top_neighbours(matrix, chunk_rows)
+
+        summary_ids = {book_ids[row] for row in chunk_rows.tolist()}
+        summary_ids.update(book_ids[row] for row in neighbour_rows[neighbour_scores > 0].tolist())
+
+        summaries = {
+            book["_id"]: book
+            for book in db_provider.col_book_summaries.find(
+                {"_id": {"$in": list(summary_ids)}},
+                projection=_NEIGHBOUR_PROJECTION
+            )
+        }
+
+        operations = []
+
+        for row, rows, scores in zip(chunk_rows.tolist(), neighbour_rows.tolist(), neighbour_scores.tolist()):
+            book_id = book_ids[row]
+
+            neighbours = [
+                _to_neighbour(summaries[book_ids[neighbour_row]], score)
+                for neighbour_row, score in zip(rows, scores)
+                if score > 0 and book_ids[neighbour_row] in summaries
+            ]
+
+            operations.append(ReplaceOne(
+                {"_id": book_id},
+                {"neighbours": neighbours, "builtAt": built_at},
+                upsert=True
+            ))
+
+            if only_new and book_id in summaries:
+                # The new book is likely among the most similar books of its own neighbours
+                operations.extend(
+                    UpdateOne(
+                        {"_id": neighbour["bookId"], "neighbours.bookId": {"$ne": book_id}},
+                        {"$push": {"neighbours": {
+                            "$each": [_to_neighbour(summaries[book_id], neighbour["score"])],
+                            "$sort": {"score": -1},
+                            "$slice": SIMILAR_BOOKS_COUNT
+                        }}}
+                    )
+                    for neighbour in neighbours
+                    # Those are written by this run, with every neighbour
+                    if neighbour["bookId"] not in new_book_ids
+                )
+
+        if operations:
+            db_provider.col_similar_books.bulk_write(operations, ordered=False)
+
+        processed += len(chunk_rows)
+
+        if on_progress is not None:
+            on_progress(processed)
+
+    if not only_new:
+        # The books that were removed since the last build, their neighbours are rewritten above
+        db_provider.col_similar_books.delete_many({"builtAt": {"$lt": built_at}})
+
+    return processed
+
+
+def get_similar_books(book_id: ObjectId, limit: int) -> list[dict] | None:
+    """Get the most similar books of a book
+
+    Parameters
+    ----------
+    book_id: ObjectId
+        The id of the book
+    limit: int
+        The maximum number of similar books
+
+    Returns
+    -------
+    list[dict] | None
+        The similar books with ``bookId``, ``title``, ``authors``, ``thumbnail`` and ``score`` fields,
+        most similar first, or ``None`` if the neighbours of the book were not built yet
+    """
+
+    doc = db_provider.col_similar_books.find_one(
+        {"_id": book_id},
+        projection={"neighbours": {"$slice": limit}, "_id": 0}
+    )
+
+    if doc is None:
+        return None
+
+    return doc["neighbours"]
@@ -0,0 +1,125 @@
+from itertools import islice
+from os import environ
+from typing import Callable, Iterable, Iterator
+
+from flask import Response, current_app, request, stream_with_context
+
+# Number of documents read from the database and written to the response at once
+STREAM_BATCH_SIZE = int(environ.get("STREAM_BATCH_SIZE", 100))
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def get_stream_format() -> str | None:
+    """Get the streaming format the client asked for
+
+    Clients opt in with an ``Accept: application/x-ndjson`` header for newline delimited JSON,
+    or with the ``stream=1`` query parameter for the usual JSON response, written in chunks.
+
+    Returns
+    -------
+    str | None
+        ``"ndjson"``, ``"json"``, or ``None`` if the response should not be streamed
+    """
+
+    if request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+        return "ndjson"
+
+    if request.args.get("stream") == "1":
+        return "json"
+
+    return None
+
+
+def _batches(items: Iterable[dict]) -> Iterator[list[str]]:
+    dumps = current_app.json.dumps
+    iterator = iter(items)
+
+    while batch := list(islice(iterator, STREAM_BATCH_SIZE)):
+        yield [dumps(item) for item in batch]
+
+
+def _generate_ndjson(items: Iterable[dict], head: dict | None, tail: Callable[[], dict] | None) -> Iterator[str]:
+    dumps = current_app.json.dumps
+
+    if head:
+        yield dumps(head) + "\n"
+
+    for batch in _batches(items):
+        yield "\n".join(batch) + "\n"
+
+    if tail is not None and (tail_fields := tail()):
+        yield dumps(tail_fields) + "\n"
+
+
+def _generate_json(
+        key: str,
+        items: Iterable[dict],
+        head: dict | None,
+        tail: Callable[[], dict] | None,
+        wrap: str | None
+) -> Iterator[str]:
+    dumps = current_app.json.dumps
+
+    # The fields of head are written as an unclosed object, followed by the opening of the array
+    opening = dumps(head or {})[:-1] + ("," if head else "") + dumps(key) + ":["
+
+    if wrap is not None:
+        opening = "{" + dumps(wrap) + ":" + opening
+
+    yield opening
+
+    separator = ""
+
+    for batch in _batches(items):
+        yield separator + ",".join(batch)
+        separator = ","
+
+    tail_fields = tail() if tail is not None else None
+    closing = "]," + dumps(tail_fields)[1:] if tail_fields else "]}"
+
+    yield closing + ("}" if wrap is not None else "")
+
+
+def stream_response(
+        stream_format: str,
+        key: str,
+        items: Iterable[dict],
+        head: dict | None = None,
+        tail: Callable[[], dict] | None = None,
+        wrap: str | None = None
+) -> Response:
+    """Build a response that writes the items in batches of ``STREAM_BATCH_SIZE`` as they are read
+
+    With ``"ndjson"``, every item is written on its own line, after a line with the fields of ``head``
+    and before a line with the fields returned by ``tail``. With ``"json"``, the body is the same as
+    the non-streamed response ``{**head, key: [*items], **tail()}``, optionally wrapped in ``{wrap: ...}``.
+
+    Pass database cursors with ``batch_size(STREAM_BATCH_SIZE)`` as ``items``, so that neither
+    the documents nor the serialized body are ever held in memory as a whole.
+
+    Parameters
+    ----------
+    stream_format: str
+        ``"ndjson"`` or ``"json"``, see ``get_stream_format``
+    key: str
+        The field that holds the items in the ``"json"`` format
+    items: Iterable[dict]
+        The items to write
+    head: dict | None
+        The fields known before the items
+    tail: Callable[[], dict] | None
+        Returns the fields only known after the items are written, like the next page cursor
+    wrap: str | None
+        The field that holds the whole response in the ``"json"`` format
+
+    Returns
+    -------
+    Response
+        The streamed response
+    """
+
+    if stream_format == "ndjson":
+        return Response(stream_with_context(_generate_ndjson(items, head, tail)), mimetype=NDJSON_MIMETYPE)
+
+    return Response(stream_with_context(_generate_json(key, items, head, tail, wrap)), mimetype="application/json")
@@ -0,0 +1,297 @@
+from os import environ
+
+from bson import ObjectId
+from pymongo import DESCENDING
+
+from services.database import db_provider
+from utils.concurrency import run_concurrently
+from utils.pagination import decode_cursor
+
+# Timeline settings
+TIMELINE_MAX_ENTRIES = int(environ.get("TIMELINE_MAX_ENTRIES", 500))
+HIGH_FANOUT_FOLLOWER_LIMIT = int(environ.get("HIGH_FANOUT_FOLLOWER_LIMIT", 10000))
+FANOUT_BATCH_SIZE = 1000
+
+_FEED_SORT = [("issuedAt", DESCENDING), ("_id", DESCENDING)]
+
+
+def _push_entries(entries: list[dict]) -> dict:
+    """Build the ``$push`` modifier that keeps a timeline sorted and bounded"""
+
+    return {
+        "$push": {
+            "entries": {
+                "$each": entries,
+                "$sort": {"issuedAt": -1, "_id": -1},
+                "$slice": TIMELINE_MAX_ENTRIES
+            }
+        }
+    }
+
+
+def _mark_truncated(timeline_ids: list[ObjectId]):
+    """Mark the timelines that are full, since pushing more entries drops their oldest ones
+
+    The flag survives entries being pulled out later, so such a timeline is never taken as complete.
+    """
+
+    db_provider.col_timelines.update_many(
+        {"_id": {"$in": timeline_ids}, f"entries.{TIMELINE_MAX_ENTRIES - 1}": {"$exists": True}},
+        {"$set": {"truncated": True}}
+    )
+
+
+def _sort_key(entry: dict) -> tuple:
+    return entry["issuedAt"], entry["_id"]
+
+
+def publish_feed_entry(entry: dict):
+    """Insert a feed entry and fan it out to the followers' timelines
+
+    Followers' timelines are only written if the issuer has at most
+    ``HIGH_FANOUT_FOLLOWER_LIMIT`` followers. Issuers above the limit are
+    marked as ``highFanout`` once, and their entries are read from the feed
+    collection when the followers read their timelines instead.
+
+    Parameters
+    ----------
+    entry: dict
+        The feed entry to publish, ``issuerUserId`` must be set
+    """
+
+    issuer_id: ObjectId = entry["issuerUserId"]
+
+    _, issuer = run_concurrently(
+        lambda: db_provider.col_feed.insert_one(entry),
+        lambda: db_provider.col_users.find_one({"_id": issuer_id}, projection={"highFanout": 1})
+    )
+
+    # Followers of high fan-out issuers read their entries from the feed collection, so they are not counted
+    if issuer is not None and issuer.get("highFanout", False):
+        return
+
+    # Followed users are stored as strings in the users collection
+    follower_filter = {"followedUsers": str(issuer_id)}
+    follower_count = db_provider.col_users.count_documents(follower_filter, limit=HIGH_FANOUT_FOLLOWER_LIMIT + 1)
+
+    if follower_count > HIGH_FANOUT_FOLLOWER_LIMIT:
+        _switch_to_fanout_on_read(issuer_id, follower_filter)
+        return
+
+    followers = db_provider.col_users.find(follower_filter, projection={"_id": 1})
+    follower_ids = [follower["_id"] for follower in followers]
+
+    # Users without a timeline document get theirs built on the first read
+    for i in range(0, len(follower_ids), FANOUT_BATCH_SIZE):
+        db_provider.col_timelines.update_many(
+            {"_id": {"$in": follower_ids[i:i + FANOUT_BATCH_SIZE]}},
+            _push_entries([entry])
+        )
+        _mark_truncated(follower_ids[i:i + FANOUT_BATCH_SIZE])
+
+
+def _switch_to_fanout_on_read(issuer_id: ObjectId, follower_filter: dict):
+    db_provider.col_users.update_one({"_id": issuer_id}, {"$set": {"highFanout": True}})
+
+    batch = []
+
+    for follower in db_provider.col_users.find(follower_filter, projection={"_id": 1}):
+        batch.append(follower["_id"])
+
+        if len(batch) == FANOUT_BATCH_SIZE:
+            _add_pull_source(batch, issuer_id)
+            batch = []
+
+    if batch:
+        _add_pull_source(batch, issuer_id)
+
+
+def _add_pull_source(timeline_ids: list[ObjectId], issuer_id: ObjectId):
+    db_provider.col_timelines.update_many(
+        {"_id": {"$in": timeline_ids}},
+        {
+            "$addToSet": {"pullSources": issuer_id},
+            "$pull": {"entries": {"issuerUserId": issuer_id}}
+        }
+    )
+
+
+def build_timeline(user_id: str) -> dict | None:
+    """(Re)build the timeline of a user from the feed collection
+
+    Parameters
+    ----------
+    user_id: str
+        The user to build the timeline for
+
+    Returns
+    -------
+    dict | None
+        The built timeline document, or ``None`` if the user does not exist
+    """
+
+    user = db_provider.col_users.find_one(
+        {"_id": ObjectId(user_id)},
+        projection={"followedUsers": 1}
+    )
+
+    if user is None:
+        return None
+
+    followed_ids = [ObjectId(followed_id) for followed_id in user.get("followedUsers", [])]
+
+    high_fanout_users = db_provider.col_users.find(
+        {"_id": {"$in": followed_ids}, "highFanout": True},
+        projection={"_id": 1}
+    )
+    pull_sources = [followed["_id"] for followed in high_fanout_users]
+
+    pushed_ids = [followed_id for followed_id in followed_ids if followed_id not in pull_sources]
+
+    entries = list(db_provider.col_feed.find(
+        {"issuerUserId": {"$in": pushed_ids}}
+    ).sort(_FEED_SORT).limit(TIMELINE_MAX_ENTRIES))
+
+    timeline = {
+        "_id": ObjectId(user_id),
+        "entries": entries,
+        "pullSources": pull_sources,
+        "truncated": len(entries) >= TIMELINE_MAX_ENTRIES
+    }
+
+    db_provider.col_timelines.replace_one({"_id": timeline["_id"]}, timeline, upsert=True)
+
+    return timeline
+
+
+def get_timeline_entries(user_id: str, cursor: str | None, limit: int) -> list[dict] | None:
+    """Get the newest timeline entries of a user that come after the cursor
+
+    Entries pushed into the timeline and entries of high fan-out users
+    that the user follows are merged by ``(issuedAt, _id)`` descending.
+
+    Parameters
+    ----------
+    user_id: str
+        The user to read the timeline of
+    cursor: str | None
+        The pagination cursor, or ``None`` for the first page
+    limit: int
+        The maximum number of entries to return
+
+    Returns
+    -------
+    list[dict] | None
+        The entries, or ``None`` if the page reaches past the bounded timeline
+        and has to be served from the feed collection instead
+    """
+
+    timeline = db_provider.col_timelines.find_one({"_id": ObjectId(user_id)})
+
+    if timeline is None:
+        timeline = build_timeline(user_id)
+
+        if timeline is None:
+            return []
+
+    # Timelines built before the flag existed are truncated if they are full
+    truncated = timeline.get("truncated", len(timeline.get("entries", [])) >= TIMELINE_MAX_ENTRIES)
+
+    if truncated and len(timeline.get("entries", [])) < TIMELINE_MAX_ENTRIES:
+        # Entries were pulled out of a truncated timeline, rebuild it to bring back the older ones
+        timeline = build_timeline(user_id)
+
+        if timeline is None:
+            return []
+
+        truncated = timeline["truncated"]
+
+    entries: list[dict] = timeline.get("entries", [])
+    position = decode_cursor(cursor) if cursor is not None else None
+
+    if position is not None:
+        entries = [entry for entry in entries if _sort_key(entry) < position]
+
+    # Older entries than the ones kept in a truncated timeline are only in the feed collection
+    if truncated and len(entries) < limit:
+        return None
+
+    entries = entries[:limit]
+    pull_sources = timeline.get("pullSources", [])
+
+    if pull_sources:
+        query: dict = {"issuerUserId": {"$in": pull_sources}}
+
+        if position is not None:
+            query["$or"] = [
+                {"issuedAt": {"$lt": position[0]}},
+                {"issuedAt": position[0], "_id": {"$lt": position[1]}},
+            ]
+
+        pulled_entries = db_provider.col_feed.find(query).sort(_FEED_SORT).limit(limit)
+
+        entries = sorted([*entries, *pulled_entries], key=_sort_key, reverse=True)[:limit]
+
+    return entries
+
+
+def on_follow(user_id: str, target_user_id: str):
+    """Backfill the newest entries of a followed user into the follower's timeline
+
+    Parameters
+    ----------
+    user_id: str
+        The user that followed someone
+    target_user_id: str
+        The followed user
+    """
+
+    target = db_provider.col_users.find_one(
+        {"_id": ObjectId(target_user_id)},
+        projection={"highFanout": 1}
+    )
+
+    if target is None:
+        return
+
+    if target.get("highFanout", False):
+        db_provider.col_timelines.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$addToSet": {"pullSources": target["_id"]}}
+        )
+        return
+
+    entries = list(db_provider.col_feed.find(
+        {"issuerUserId": target["_id"]}
+    ).sort(_FEED_SORT).limit(TIMELINE_MAX_ENTRIES))
+
+    if entries:
+        # Avoid duplicates if the user followed the same user twice
+        db_provider.col_timelines.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$pull": {"entries": {"issuerUserId": target["_id"]}}}
+        )
+        db_provider.col_timelines.update_one({"_id": ObjectId(user_id)}, _push_entries(entries))
+        _mark_truncated([ObjectId(user_id)])
+
+
+def on_unfollow(user_id: str, target_user_id: str):
+    """Remove the entries of an unfollowed user from the follower's timeline
+
+    Parameters
+    ----------
+    user_id: str
+        The user that unfollowed someone
+    target_user_id: str
+        The unfollowed user
+    """
+
+    db_provider.col_timelines.update_one(
+        {"_id": ObjectId(user_id)},
+        {
+            "$pull": {
+                "entries": {"issuerUserId": ObjectId(target_user_id)},
+                "pullSources": ObjectId(target_user_id)
+            }
+        }
+    )
@@ -1,14 +1,22 @@
 from datetime import datetime, timezone
 from datetime import timedelta
+from hashlib import sha256
 from os import environ
 
 import jwt
 
 from models.tokens import UserToken, TokenType
+from utils.lru_cache import TTLCache
 
-_TOKEN_KEY = environ.get("TOKEN_KEY")
+_TOKEN_KEY: str | None = None
 
-assert _TOKEN_KEY is not None, "TOKEN_KEY environment variable must be set"
+# Verified token cache settings
+TOKEN_CACHE_SIZE = int(environ.get("TOKEN_CACHE_SIZE", 10000))
+
+_verified_tokens = TTLCache(max_size=TOKEN_CACHE_SIZE, ttl=timedelta(hours=1).total_seconds())
+
+# Part of every cache key, bumping it invalidates every cached token at once
+_key_generation = 0
 
 
 def generate_refresh_token(user_id: str) -> str:
@@ -32,7 +40,7 @@ def generate_refresh_token(user_id: str) -> str:
         "user_id": user_id,
         "type": "refresh",
         "exp": datetime.now(tz=timezone.utc) + timedelta(days=30)
-    }, _TOKEN_KEY, algorithm="HS256")
+    }, _get_token_key(), algorithm="HS256")
 
 
 def generate_access_token(user_id: str) -> str:
@@ -56,7 +64,74 @@ def generate_access_token(user_id: str) -> str:
         "user_id": user_id,
         "type": "access",
         "exp": datetime.now(tz=timezone.utc) + timedelta(hours=1)
-    }, _TOKEN_KEY, algorithm="HS256")
+    }, _get_token_key(), algorithm="HS256")
+
+
+def _get_token_key() -> str:
+    # Read lazily, so importing this module doesn't require the environment to be set up
+    global _TOKEN_KEY
+
+    if _TOKEN_KEY is None:
+        _TOKEN_KEY = environ.get("TOKEN_KEY")
+
+        assert _TOKEN_KEY is not None, "TOKEN_KEY environment variable must be set"
+
+    return _TOKEN_KEY
+
+
+def invalidate_verified_tokens():
+    """Invalidate every cached token verification
+
+    Must be called when the token key changes, so that tokens signed with the
+    old key are verified again instead of being served from the cache.
+    """
+
+    global _key_generation
+
+    _key_generation += 1
+    _verified_tokens.clear()
+
+
+def verified_token_cache_stats() -> dict:
+    """Get the counters of the verified token cache
+
+    Returns
+    -------
+    dict
+        The size, hit, miss and eviction counts of the cache
+    """
+
+    return _verified_tokens.stats()
+
+
+def _decode_token(token: str) -> tuple[UserToken, datetime | None] | None:
+    try:
+        decoded = jwt.decode(token, _get_token_key(), algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        return None
+    except jwt.InvalidTokenError:
+        return None
+
+    raw_token_type = decoded.get("type")
+    token_type: TokenType | None = None
+
+    if raw_token_type == "access":
+        token_type = TokenType.ACCESS
+    elif raw_token_type == "refresh":
+        token_type = TokenType.REFRESH
+
+    if token_type is None:
+        return None
+
+    user_token = UserToken(
+        user_id=decoded.get("user_id"),
+        token_type=token_type
+    )
+
+    if "exp" not in decoded:
+        return user_token, None
+
+    return user_token, datetime.fromtimestamp(decoded["exp"], tz=timezone.utc)
 
 
 def validate_token(
@@ -68,6 +143,10 @@ def validate_token(
     This function will validate the token and return the payload if the token is valid.
     If the token is invalid, it will return None.
 
+    Successful verifications are cached until the token expires, keyed by the
+    token's digest, so a token's signature is only verified once.
+    Tokens without an expiry are cached for the cache's default time-to-live.
+
     Parameters
     ----------
     token : str
@@ -81,31 +160,23 @@ def validate_token(
         The payload of the token if the token is valid, otherwise None
     """
 
-    try:
-        decoded = jwt.decode(token, _TOKEN_KEY, algorithms=["HS256"])
-        raw_token_type = decoded.get("type")
-        token_type: TokenType | None = None
-
-        if raw_token_type is None:
-            return None
+    cache_key = (_key_generation, sha256(token.encode()).digest())
+    user_token: UserToken | None = _verified_tokens.get(cache_key)
 
-        if raw_token_type is not None:
-            if raw_token_type == "access":
-                token_type = TokenType.ACCESS
-            elif raw_token_type == "refresh":
-                token_type = TokenType.REFRESH
+    if user_token is None:
+        result = _decode_token(token)
 
-        if token_type is None:
+        if result is None:
             return None
 
-        if expected_token_type is not None and token_type != expected_token_type:
-            return None
+        user_token, expires_at = result
 
-        return UserToken(
-            user_id=decoded.get("user_id"),
-            token_type=token_type
-        )
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
+        if expires_at is None:
+            _verified_tokens.set(cache_key, user_token)
+        elif (ttl := (expires_at - datetime.now(tz=timezone.utc)).total_seconds()) > 0:
+            _verified_tokens.set(cache_key, user_token, ttl=ttl)
+
+    if expected_token_type is not None and user_token.token_type != expected_token_type:
         return None
+
+    return user_token